@@ -0,0 +1,98 @@
+import json
+import numpy as np
+import os
+import polars as pl
+
+"""
+One HTML dashboard for many BCA plates, rendered from their saved fits. The points and curves of all the plates are
+each stored once, as two shared datasets, and a dropdown selects which plate is shown. Each curve is sampled only as
+densely as its curvature needs, rather than at a fixed 1000 points.
+"""
+
+def curve_points(coef, x_min, x_max, tolerance, max_points=1000):
+	"""
+	Sample the quadratic coef at evenly spaced points from x_min to x_max, just close enough that straight lines
+	between them stay within tolerance of the curve. A segment of width h deviates from a quadratic by at most
+	|c2| * h^2 / 8.
+	"""
+	if coef[2] == 0:
+		n_points = 2
+	else:
+		n_points = int(np.ceil((x_max - x_min) / np.sqrt(8 * tolerance / abs(coef[2])))) + 1
+
+	x = np.linspace(x_min, x_max, min(max(n_points, 2), max_points))
+	return x, coef[0] + x * (coef[1] + x * coef[2])
+
+def render_dashboard(fit_paths, dashboard_path, digits=4):
+	import altair as alt
+
+	plate_names = []
+	points = []
+	curves = []
+	for plate, fit_path in enumerate(fit_paths):
+		with open(fit_path, "r") as fit_handle:
+			saved = json.load(fit_handle)
+
+		plate_names.append(os.path.basename(fit_path).rsplit(".", maxsplit=1)[0])
+		coef = np.array(saved["coef"])
+
+		plate_points = pl.DataFrame(
+			saved["points"],
+			schema={"conc": pl.Float64, "value": pl.Float64, "well": pl.String, "group": pl.String},
+		)
+		points.append(plate_points.with_columns(
+			pl.lit(plate).alias("plate"),
+			pl.col("group").str.starts_with("standard_").alias("standard"),
+		))
+
+		# Sample the curve to within a quarter of a pixel of the 800 pixel tall chart
+		x_min, x_max = plate_points.get_column("value").min(), plate_points.get_column("value").max()
+		y_min, y_max = plate_points.get_column("conc").min(), plate_points.get_column("conc").max()
+		x, y = curve_points(coef, x_min, x_max, tolerance=(y_max - y_min) / 3200)
+		curves.append(pl.DataFrame({"plate": plate, "x": x, "y": y}))
+
+	# Round to keep the embedded data compact
+	points = pl.concat(points).with_columns(pl.col("conc", "value").round(digits))
+	curves = pl.concat(curves).with_columns(pl.col("x", "y").round(digits))
+
+	plate = alt.param(
+		name="plate",
+		value=0,
+		bind=alt.binding_select(options=list(range(len(plate_names))), labels=plate_names, name="Plate "),
+	)
+
+	points_base = alt.Chart(points).transform_filter(alt.datum.plate == plate).encode(
+		x="value",
+		y="conc",
+		color="group",
+		tooltip=["group", "well"],
+	)
+
+	samples_chart = points_base.transform_filter(~alt.datum.standard).mark_point()
+	standards_base = points_base.transform_filter(alt.datum.standard)
+	standards_points = standards_base.mark_point(shape="square", filled=True, opacity=1)
+	standards_lines = standards_base.mark_line()
+
+	line = alt.Chart(curves).transform_filter(alt.datum.plate == plate).mark_line().encode(
+		x=alt.X(
+			"x",
+			axis=alt.Axis(title="Absorbance"),
+		),
+		y=alt.Y(
+			"y",
+			axis=alt.Axis(title="Concentration (ug/mL)"),
+		),
+	)
+
+	chart = (
+		alt.layer(line, standards_lines, standards_points, samples_chart)
+		.add_params(plate)
+		.properties(
+			width=800,
+			height=800,
+		)
+		.interactive()
+	)
+
+	os.makedirs(os.path.dirname(dashboard_path) or ".", exist_ok=True)
+	chart.save(dashboard_path)
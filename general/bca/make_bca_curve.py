@@ -1,89 +1,225 @@
-import altair as alt
+import argparse
+import glob
+import json
+import multiprocessing
 import numpy as np
 import os
 import polars as pl
 import sys
 
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dashboard import render_dashboard
+from instrumentation import stage
+from plates import iter_export_plates, label_plate, plate_tables, read_labels, read_plate_arrays
+from standard_curves import bootstrap_intervals, bootstrap_quadratics, fit_quadratics, predict, stack
+
 """
 Usage:
 
-python make_bca_curve.py LABELS_FILE_PATH VALUES_FILE_PATH
+python make_bca_curve.py LABELS_FILE_PATH VALUES_FILE_PATH [--no-chart]
+python make_bca_curve.py --batch [--labels-dir LABELS_DIR] [--values-dir VALUES_DIR] [--workers N] [--no-chart]
+	[--dashboard DASHBOARD_PATH]
+python make_bca_curve.py --chart FIT_PATH [FIT_PATH ...] [--dashboard DASHBOARD_PATH]
+python make_bca_curve.py LABELS_FILE_PATH --export EXPORT_PATH [--header-filter TEXT] [--no-chart]
+	[--dashboard DASHBOARD_PATH]
+
+Options for fitting: [--bootstrap N] [--ci LEVEL]
+
+Labels and values files are tab-separated grids of 96 (8x12), 384 (16x24) or 1536 (32x48) wells, with the layout
+detected from their shape.
+
+Each fit is saved to fits/ as JSON (the curve coefficients plus the standard and sample points), and the chart is
+rendered from it to charts/. --no-chart only writes the fit and concentrations, skipping the chart (and importing
+altair), which is most of the time taken. --chart renders charts later from saved fits.
+
+--batch fits every values file in VALUES_DIR (default values) against the labels file in LABELS_DIR (default labels)
+whose name is the longest prefix of the values file's name, e.g. values/20260205_covaris_livers_1-5_rep1.txt is paired
+with labels/20260205_covaris_livers_1-5.tsv. The standard curves of all the plates are fit together in one batched
+least-squares solve, and the charts are rendered in parallel worker processes. Charts and concentrations are written
+to charts/ and concs/ as for a single plate.
+
+--dashboard writes one HTML dashboard for all the plates of a batch (or all the given fits) to DASHBOARD_PATH instead
+of a chart per plate. The points and curves of every plate are stored once in shared datasets, with each curve sampled
+only as densely as it needs, and a dropdown selects the plate shown.
+
+--export fits every plate in a whole plate reader export (any number of plates, reads or wavelengths) with the labels
+in LABELS_FILE_PATH, so it doesn't need splitting into single-plate values files. The export is read one line at a
+time, and each plate is fit and written as soon as its last row is read. A plate is any run of tab-separated rows of
+absorbances as long as its layout needs, optionally starting with row names and preceded by a column header row.
+--header-filter only fits plates whose header (the last other line before them, e.g. "Read 1:562") contains TEXT.
+Outputs are named LABELS_EXPORT_N for the Nth plate in the export, counting plates that are cut short, which are
+skipped with a warning. Cells that aren't numbers (e.g. OVRFLW) are read as NaN, also with a warning.
+
+--bootstrap N refits each curve on N resamples of its standards, and adds LEVEL (default 0.95) percentile confidence
+intervals of each sample's concentration and group mean to the concentrations (conc_lower, conc_upper,
+group_mean_lower, group_mean_upper).
+
+Set DATASCRIPTS_INSTRUMENT to a file path (or "-" for stderr) to record the time and memory of each stage (read, fit,
+write, chart) as JSON lines.
 """
 
-def fit(labels_file, values_file):
+def read_plate(labels_file, values_file):
+	"""
+	Read a plate's labels and absorbances, returning its blank-subtracted standards and samples
+	"""
+	with stage("read", file=values_file) as record:
+		stands, samples = plate_tables(read_plate_arrays(labels_file, values_file))
+		record["rows_out"] = stands.shape[0] + samples.shape[0]
 
-	# Read in labels and values
-	rows = ["A", "B", "C", "D", "E", "F", "G", "H"]
-	labels = (
-		pl.read_csv(labels_file, has_header=False, new_columns=[str(i) for i in range(1, 13)], separator="\t")
-		.with_columns(pl.Series(name="row", values=rows))
-	)
-	values = (
-		pl.read_csv(values_file, has_header=False, new_columns=[str(i) for i in range(1, 13)], separator="\t")
-		.with_columns(pl.Series(name="row", values=rows))
-	)
+	return stands, samples
 
-	# Melt both identically and join
-	labels = labels.unpivot(index="row", variable_name="column", value_name="label")
-	values = values.unpivot(index="row", variable_name="column")
+def fit_plates(plates, n_boot=0, level=0.95, seed=0):
+	"""
+	Fit the standard curves of all the (stands, samples) plates in one batched call, and predict their samples'
+	concentrations. With n_boot > 0, also add bootstrap confidence intervals of each sample's diluted concentration and
+	group mean. Returns the coefficients of each plate and the samples with predictions.
+	"""
+	with stage("fit", rows_in=sum(stands.shape[0] for stands, _ in plates)) as record:
+		# Fit equations to all the standards
+		x = stack([stands.get_column("value").to_numpy() for stands, _ in plates])
+		y = stack([stands.get_column("conc").to_numpy() for stands, _ in plates])
+		coefs = fit_quadratics(x, y)
 
-	df = (
-		labels.join(
-			values,
-			on=["column", "row"],
-			how="full",
-			coalesce=True,
-		)
-		.filter(pl.col("label") != "")
-		.select("label", pl.col("value").cast(pl.Float64), pl.concat_str("row", "column").alias("well"))
-	)
+		# Predict for samples
+		values = stack([samples.get_column("value").to_numpy() for _, samples in plates])
+		conc_preds = predict(coefs, values)
+		predicted = [
+			samples.with_columns(conc_pred=conc_preds[i, :samples.shape[0]])
+			for i, (_, samples) in enumerate(plates)
+		]
 
-	# Mean blank replicates and subtract blank
-	df_means = df.group_by("label").mean()
-	if df_means.filter(pl.col("label") == "standard_0").get_column("value").shape[0] > 0:
-		blank_mean_absorbance = df_means.filter(pl.col("label") == "standard_0").get_column("value")[0]
-		df = df.with_columns(pl.col("value") - blank_mean_absorbance)
-
-	# Separate out standards and samples
-	standards_regex = pl.col("label").str.contains("standard_\d{1,4}", literal=False)
-	stands = df.filter(standards_regex)
-	samples = df.filter(~standards_regex)
-
-	# Expand sample labels
-	samples = (
-		samples.with_columns(
-			pl.col("label").str.split("_1/").list.to_struct(fields=["sample", "dilution_factor"], upper_bound=2)
-		)
-		.unnest("label")
-		.with_columns(pl.col("dilution_factor").cast(pl.Int64))
-	)
+		if n_boot > 0:
+			coef_boot = bootstrap_quadratics(x, y, n_boot, np.random.default_rng(seed))
+			bounds = bootstrap_intervals(
+				coef_boot,
+				values,
+				stack([samples.get_column("dilution_factor").to_numpy() for _, samples in plates]),
+				np.nan_to_num(stack([
+					(samples.get_column("sample").rank("dense") - 1).to_numpy()
+					for _, samples in plates
+				])).astype(np.int64),
+				level=level,
+			)
+			predicted = [
+				samples.with_columns(**{
+					name: bound[i, :samples.shape[0]]
+					for name, bound in zip(["conc_lower", "conc_upper", "group_mean_lower", "group_mean_upper"], bounds)
+				})
+				for i, samples in enumerate(predicted)
+			]
 
-	# Expand standards labels
-	stands = (
-		stands.with_columns(pl.col("label").str.split("standard_").list.to_struct(fields=["_", "conc"], upper_bound=2))
-		.unnest("label")
-		.drop("_")
-		.with_columns(pl.col("conc").cast(pl.Float64))
-		.sort(by="conc")
-	)
+		record["rows_out"] = sum(samples.shape[0] for samples in predicted)
 
-	# Fit equation to standards
-	coef = np.polynomial.polynomial.polyfit(
-		x=stands.get_column("value"),
-		y=stands.get_column("conc"),
-		deg=2,
-	)
+	return coefs, predicted
 
-	# Predict for samples
-	samples = samples.with_columns(
-		conc_pred=np.polynomial.polynomial.polyval(
-			x=samples.get_column("value"),
-			c=coef,
+def write_plate(labels_file, values_file, coef, stands, samples, name=None):
+	"""
+	Save a plate's fit and concentrations, named LABELS_VALUES after the basenames of its files unless name is given,
+	returning the path of the fit
+	"""
+	if name is None:
+		labels_basename = os.path.basename(labels_file).split(".")[0]
+		values_basename = os.path.basename(values_file).split(".")[0]
+		name = f"{labels_basename}_{values_basename}"
+
+	fit_path = f"fits/{name}.json"
+
+	with stage("write", file=values_file, rows_in=samples.shape[0]) as record:
+		save_fit(fit_path, labels_file, values_file, coef, stands, samples)
+
+		# Scale and combine dilutions
+		samples = (
+			samples.with_columns((pl.col("dilution_factor") * pl.col("conc_pred")).alias("full_conc_pred"))
+			.select(
+				pl.col("sample"),#.str.split("_").list.slice(0, 2).list.join("_"),
+				"well",
+				pl.col("full_conc_pred").alias("conc"),
+				"dilution_factor",
+				pl.col("^(conc|group_mean)_(lower|upper)$"),
+			)
+			.with_columns(pl.col("conc").mean().over("sample").alias("group_mean"))
+			.sort("sample")
 		)
-	)
 
-	# Plot
-	pldf = (
+		# Save results
+		samples.write_csv(f"concs/{name}.tsv", separator="\t")
+		record["rows_out"] = samples.shape[0]
+
+	return fit_path
+
+def fit(labels_file, values_file, chart=True, n_boot=0, level=0.95):
+	stands, samples = read_plate(labels_file, values_file)
+	coefs, predicted = fit_plates([(stands, samples)], n_boot=n_boot, level=level)
+	fit_path = write_plate(labels_file, values_file, coefs[0], stands, predicted[0])
+
+	if chart:
+		render_chart(fit_path)
+
+def fit_batch(pairs, chart=True, n_boot=0, level=0.95, workers=None, dashboard_path=None):
+	"""
+	Fit every (labels_file, values_file) plate, with all the standard curves fit together, and render the charts in
+	parallel worker processes, or one dashboard for all the plates if dashboard_path is given
+	"""
+	plates = [read_plate(labels_file, values_file) for labels_file, values_file in pairs]
+	coefs, predicted = fit_plates(plates, n_boot=n_boot, level=level)
+
+	fit_paths = [
+		write_plate(labels_file, values_file, coef, stands, samples)
+		for (labels_file, values_file), coef, (stands, _), samples in zip(pairs, coefs, plates, predicted)
+	]
+
+	if dashboard_path is not None:
+		with stage("dashboard", file=dashboard_path, rows_in=len(fit_paths)):
+			render_dashboard(fit_paths, dashboard_path)
+
+	elif chart:
+		# Spawn rather than fork the workers, since forking after polars has started its thread pool can deadlock
+		with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+			list(executor.map(render_chart, fit_paths))
+
+	for labels_file, values_file in pairs:
+		print(f"Fit {values_file} with {labels_file}")
+
+def fit_export(labels_file, export_file, header_filter=None, chart=True, n_boot=0, level=0.95, dashboard_path=None):
+	"""
+	Fit every plate in a plate reader export with the same labels, each as soon as it's read from the export. Only
+	plates whose header contains header_filter are fit, if given. Outputs are named LABELS_EXPORT_N, for the Nth plate
+	in the export.
+	"""
+	labels = read_labels(labels_file)
+	labels_basename = os.path.basename(labels_file).split(".")[0]
+	export_basename = os.path.basename(export_file).split(".")[0]
+
+	fit_paths = []
+	for index, header, values in iter_export_plates(export_file):
+		if header_filter is not None and header_filter not in header:
+			continue
+
+		values_name = f"{export_file}:{index}"
+		with stage("read", file=values_name) as record:
+			stands, samples = plate_tables(label_plate(labels, values, labels_file, values_name))
+			record["rows_out"] = stands.shape[0] + samples.shape[0]
+
+		coefs, predicted = fit_plates([(stands, samples)], n_boot=n_boot, level=level)
+		name = f"{labels_basename}_{export_basename}_{index}"
+		fit_paths.append(write_plate(labels_file, values_name, coefs[0], stands, predicted[0], name=name))
+
+		if chart and dashboard_path is None:
+			render_chart(fit_paths[-1])
+
+		print(f"Fit plate {index} ({header}) of {export_file} with {labels_file}")
+
+	if dashboard_path is not None and len(fit_paths) > 0:
+		with stage("dashboard", file=dashboard_path, rows_in=len(fit_paths)):
+			render_dashboard(fit_paths, dashboard_path)
+
+def save_fit(fit_path, labels_file, values_file, coef, stands, samples):
+	"""
+	Save the curve coefficients and the standard and sample points, so the chart can be rendered from them later
+	"""
+	points = (
 		pl.concat([
 			stands.with_columns(pl.concat_str(
 				pl.lit("standard_"),
@@ -94,73 +230,163 @@ def fit(labels_file, values_file):
 		.sort("group")
 	)
 
-	x = np.linspace(pldf.get_column("value").min(), pldf.get_column("value").max(), 1000)
-	linedf = pl.DataFrame({
-		"x": x,
-		"y": np.polynomial.polynomial.polyval(x=x, c=coef),
-	})
-
-	samples_chart = alt.Chart(pldf.filter(~pl.col("group").str.starts_with("standard_"))).mark_point().encode(
-		x="value",
-		y="conc",
-		color=alt.Color(
-			"group",
-			sort=pldf.get_column("group").to_list(),
-		),
-		tooltip=["group", "well"],
-	)
+	os.makedirs(os.path.dirname(fit_path), exist_ok=True)
+	with open(fit_path, "w") as fit_handle:
+		json.dump(
+			{
+				"labels_file": labels_file,
+				"values_file": values_file,
+				"coef": coef.tolist(),
+				"points": points.to_dict(as_series=False),
+			},
+			fit_handle,
+			indent="\t",
+		)
 
-	standards_base = alt.Chart(pldf.filter(pl.col("group").str.starts_with("standard_"))).encode(
-		x="value",
-		y="conc",
-		color=alt.Color(
-			"group",
-			sort=pldf.get_column("group").to_list(),
-		),
-		tooltip=["group", "well"],
-	)
+def render_chart(fit_path):
 
-	standards_points = standards_base.mark_point(shape="square", filled=True, opacity=1)
-	standards_lines = standards_base.mark_line()
-
-	line = alt.Chart(linedf).mark_line().encode(
-		x=alt.X(
-			"x",
-			axis=alt.Axis(title="Absorbance"),
-		),
-		y=alt.Y(
-			"y",
-			axis=alt.Axis(title="Concentration (ug/mL)"),
-		),
-	)
+	with open(fit_path, "r") as fit_handle:
+		saved = json.load(fit_handle)
+
+	with stage("chart", file=saved["values_file"]) as record:
+		import altair as alt
 
-	chart = (
-		alt.layer(line, standards_lines, standards_points, samples_chart)
-		.properties(
-			width=800,
-			height=800,
+		coef = np.array(saved["coef"])
+		pldf = pl.DataFrame(
+			saved["points"],
+			schema={"conc": pl.Float64, "value": pl.Float64, "well": pl.String, "group": pl.String},
 		)
-		.interactive()
-	)
+		record["rows_in"] = pldf.shape[0]
 
-	labels_basename = os.path.basename(labels_file).split(".")[0]
-	values_basename = os.path.basename(values_file).split(".")[0]
-	chart.save(f"charts/{labels_basename}_{values_basename}.html")
-
-	# Scale and combine dilutions
-	samples = (
-		samples.with_columns((pl.col("dilution_factor") * pl.col("conc_pred")).alias("full_conc_pred"))
-		.select(
-			pl.col("sample"),#.str.split("_").list.slice(0, 2).list.join("_"),
-			"well",
-			pl.col("full_conc_pred").alias("conc"),
-			"dilution_factor",
+		x = np.linspace(pldf.get_column("value").min(), pldf.get_column("value").max(), 1000)
+		linedf = pl.DataFrame({
+			"x": x,
+			"y": np.polynomial.polynomial.polyval(x=x, c=coef),
+		})
+
+		samples_chart = alt.Chart(pldf.filter(~pl.col("group").str.starts_with("standard_"))).mark_point().encode(
+			x="value",
+			y="conc",
+			color=alt.Color(
+				"group",
+				sort=pldf.get_column("group").to_list(),
+			),
+			tooltip=["group", "well"],
 		)
-		.with_columns(pl.col("conc").mean().over("sample").alias("group_mean"))
-		.sort("sample")
-	)
 
-	# Save results
-	samples.write_csv(f"concs/{labels_basename}_{values_basename}.tsv", separator="\t")
+		standards_base = alt.Chart(pldf.filter(pl.col("group").str.starts_with("standard_"))).encode(
+			x="value",
+			y="conc",
+			color=alt.Color(
+				"group",
+				sort=pldf.get_column("group").to_list(),
+			),
+			tooltip=["group", "well"],
+		)
 
-fit(labels_file=sys.argv[1], values_file=sys.argv[2])
+		standards_points = standards_base.mark_point(shape="square", filled=True, opacity=1)
+		standards_lines = standards_base.mark_line()
+
+		line = alt.Chart(linedf).mark_line().encode(
+			x=alt.X(
+				"x",
+				axis=alt.Axis(title="Absorbance"),
+			),
+			y=alt.Y(
+				"y",
+				axis=alt.Axis(title="Concentration (ug/mL)"),
+			),
+		)
+
+		chart = (
+			alt.layer(line, standards_lines, standards_points, samples_chart)
+			.properties(
+				width=800,
+				height=800,
+			)
+			.interactive()
+		)
+
+		fit_basename = os.path.basename(fit_path).rsplit(".", maxsplit=1)[0]
+		chart.save(f"charts/{fit_basename}.html")
+
+def pair_plates(labels_dir, values_dir):
+	"""
+	Pair each values file with the labels file whose name is the longest prefix of its name
+	"""
+	labels_files = {
+		os.path.basename(labels_file).split(".")[0]: labels_file
+		for labels_file in glob.glob(os.path.join(labels_dir, "*.tsv"))
+	}
+
+	pairs = []
+	for values_file in sorted(glob.glob(os.path.join(values_dir, "*.txt"))):
+		values_basename = os.path.basename(values_file).split(".")[0]
+		matches = [labels_basename for labels_basename in labels_files if values_basename.startswith(labels_basename)]
+		if len(matches) == 0:
+			raise ValueError(f"No labels file found for {values_file}")
+
+		pairs.append((labels_files[max(matches, key=len)], values_file))
+
+	return pairs
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("labels_file", nargs="?")
+	parser.add_argument("values_file", nargs="?")
+	parser.add_argument("--batch", action="store_true")
+	parser.add_argument("--labels-dir", default="labels")
+	parser.add_argument("--values-dir", default="values")
+	parser.add_argument("--workers", type=int, default=None)
+	parser.add_argument("--no-chart", action="store_true")
+	parser.add_argument("--chart", nargs="+", metavar="FIT_PATH")
+	parser.add_argument("--bootstrap", type=int, default=0, metavar="N")
+	parser.add_argument("--ci", type=float, default=0.95)
+	parser.add_argument("--dashboard", metavar="DASHBOARD_PATH")
+	parser.add_argument("--export", metavar="EXPORT_PATH")
+	parser.add_argument("--header-filter")
+	args = parser.parse_args()
+
+	if args.chart is not None and args.dashboard is not None:
+		render_dashboard(args.chart, args.dashboard)
+
+	elif args.chart is not None:
+		for fit_path in args.chart:
+			render_chart(fit_path)
+
+	elif args.batch:
+		fit_batch(
+			pair_plates(args.labels_dir, args.values_dir),
+			chart=not args.no_chart,
+			n_boot=args.bootstrap,
+			level=args.ci,
+			workers=args.workers,
+			dashboard_path=args.dashboard,
+		)
+
+	elif args.export is not None:
+		if args.labels_file is None or args.values_file is not None:
+			parser.error("--export takes exactly one LABELS_FILE_PATH")
+
+		fit_export(
+			args.labels_file,
+			args.export,
+			header_filter=args.header_filter,
+			chart=not args.no_chart,
+			n_boot=args.bootstrap,
+			level=args.ci,
+			dashboard_path=args.dashboard,
+		)
+
+	elif args.labels_file is None or args.values_file is None:
+		parser.error("LABELS_FILE_PATH and VALUES_FILE_PATH are required without --batch or --chart")
+
+	else:
+		fit(
+			labels_file=args.labels_file,
+			values_file=args.values_file,
+			chart=not args.no_chart,
+			n_boot=args.bootstrap,
+			level=args.ci,
+		)
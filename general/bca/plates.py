@@ -0,0 +1,230 @@
+import numpy as np
+import polars as pl
+import re
+import sys
+
+"""
+Plates as arrays: the absorbances as a (rows, columns) float array, and the labels encoded as a same-shaped array of
+indices into the plate's distinct labels (-1 for unlabelled wells). The layout (96, 384 or 1536 wells) is detected from
+the shape of the files. Labels are parsed once per distinct label, and wells are matched to their labels by position,
+so no joins are needed.
+
+Absorbances can also be streamed out of a whole plate reader export with any number of plates, reads and wavelengths
+by iter_export_plates.
+"""
+
+# (rows, columns) of each plate size
+LAYOUTS = {
+	96: (8, 12),
+	384: (16, 24),
+	1536: (32, 48),
+}
+
+# A-Z, then AA-AF for 1536-well plates
+ROW_NAMES = [chr(ord("A") + i) for i in range(26)] + ["A" + chr(ord("A") + i) for i in range(6)]
+
+# Number of rows of a plate with each number of columns
+ROWS_BY_COLUMNS = {columns: rows for rows, columns in LAYOUTS.values()}
+
+def read_grid(path, dtype):
+	"""
+	Read a tab-separated plate grid with no header as a pl.Float64 (empty cells NaN) or pl.String (empty cells "")
+	array, checking that its shape is a known layout
+	"""
+	grid = pl.read_csv(path, has_header=False, separator="\t", infer_schema=False)
+	if grid.shape not in LAYOUTS.values():
+		raise ValueError(f"{path} is {grid.shape[0]}x{grid.shape[1]}, which isn't a 96, 384 or 1536-well plate")
+
+	if dtype == pl.Float64:
+		return grid.select(pl.all().cast(pl.Float64)).to_numpy()
+	return grid.select(pl.all().fill_null("")).to_numpy().astype(str)
+
+def well_names(shape):
+	rows, columns = shape
+	return np.char.add(
+		np.array(ROW_NAMES[:rows])[:, None],
+		np.arange(1, columns + 1).astype(str)[None, :],
+	)
+
+def read_labels(labels_file):
+	"""
+	Read a labels grid into {"codes": label codes, "labels": distinct labels}
+	"""
+	labels = read_grid(labels_file, pl.String)
+	labelled = labels != ""
+	distinct, codes = np.unique(labels[labelled], return_inverse=True)
+
+	plate_codes = np.full(labels.shape, -1)
+	plate_codes[labelled] = codes
+
+	return {"codes": plate_codes, "labels": distinct}
+
+def label_plate(labels, values, labels_file, values_name):
+	"""
+	Add absorbances to read_labels() output, giving a plate
+	"""
+	if labels["codes"].shape != values.shape:
+		raise ValueError(
+			f"{labels_file} is {labels['codes'].shape[0]}x{labels['codes'].shape[1]} but {values_name} is "
+			f"{values.shape[0]}x{values.shape[1]}"
+		)
+
+	return {**labels, "values": values}
+
+def read_plate_arrays(labels_file, values_file):
+	"""
+	Read a plate into {"values": absorbances, "codes": label codes, "labels": distinct labels}
+	"""
+	return label_plate(read_labels(labels_file), read_grid(values_file, pl.Float64), labels_file, values_file)
+
+def parse_grid_line(line, in_plate=False):
+	"""
+	Parse a line of an export as a row of absorbances, returning it with the cells that aren't numbers, or None if the
+	line isn't a row. The row may start with its row name (A, B, ...) and with empty cells, and end with one extra cell
+	(e.g. the wavelength), which are skipped. Empty cells and cells that aren't numbers (e.g. OVRFLW for saturated
+	wells) are NaN. A row needs at least one number to start a plate, but within a plate (in_plate) any row of the
+	right width is accepted.
+	"""
+	cells = line.rstrip("\r\n").split("\t")
+	while len(cells) > 0 and cells[-1].strip() == "":
+		cells.pop()
+
+	while len(cells) > 0 and (cells[0].strip() == "" or cells[0].strip() in ROW_NAMES):
+		cells.pop(0)
+
+	# Some readers end each row with its wavelength
+	if len(cells) - 1 in ROWS_BY_COLUMNS:
+		cells.pop()
+
+	if len(cells) not in ROWS_BY_COLUMNS:
+		return None
+
+	row = []
+	text = []
+	for cell in cells:
+		try:
+			row.append(float(cell) if cell.strip() != "" else np.nan)
+		except ValueError:
+			row.append(np.nan)
+			text.append(cell.strip())
+
+	if not in_plate and len(text) == len(cells):
+		return None
+
+	return row, text
+
+def iter_export_plates(export_file):
+	"""
+	Stream the plates out of a plate reader export, one line at a time, yielding each plate's (index, header, values)
+	as soon as its last row is read. A plate is a run of rows of absorbances as long as its layout needs (e.g. 8 rows
+	of 12), and its header is the last non-empty line before it that isn't absorbances (e.g. "Read 1:562"), which can be
+	used to pick out reads or wavelengths. Plates are numbered by their position in the export. Plates cut short are
+	skipped, but still numbered, and cells that aren't numbers are read as NaN, with a warning for each.
+	"""
+	header = ""
+	rows = []
+	index = 0
+
+	def warn_short(line_number):
+		print(
+			f"Warning: plate {index} ({header}) of {export_file} ends at line {line_number} after {len(rows)} of "
+			f"{ROWS_BY_COLUMNS[len(rows[0])]} rows, skipping it",
+			file=sys.stderr,
+		)
+
+	line_number = 0
+	with open(export_file, "r", encoding="utf-8", errors="replace") as export_handle:
+		for line_number, line in enumerate(export_handle, start=1):
+			parsed = parse_grid_line(line, in_plate=len(rows) > 0)
+			row = parsed[0] if parsed is not None else None
+
+			# Column header rows (1, 2, ..., N) aren't absorbances or plate headers
+			is_column_header = row is not None and row == list(range(1, len(row) + 1))
+
+			# A run of rows ends at any other line, or when the number of columns changes
+			if len(rows) > 0 and (row is None or is_column_header or len(row) != len(rows[0])):
+				warn_short(line_number)
+				rows = []
+
+				# A row of another width can still start the next plate
+				if row is not None and not is_column_header:
+					parsed = parse_grid_line(line)
+					row = parsed[0] if parsed is not None else None
+
+			if is_column_header:
+				continue
+
+			if row is None:
+				if line.strip() != "":
+					header = re.sub(r"\s+", " ", line.strip())
+				continue
+
+			if len(rows) == 0:
+				index += 1
+
+			if len(parsed[1]) > 0:
+				print(
+					f"Warning: read {', '.join(parsed[1])} in line {line_number} of {export_file} as NaN",
+					file=sys.stderr,
+				)
+
+			rows.append(row)
+			if len(rows) == ROWS_BY_COLUMNS[len(row)]:
+				yield index, header, np.array(rows)
+				rows = []
+
+	if len(rows) > 0:
+		warn_short(line_number + 1)
+
+def parse_labels(labels):
+	"""
+	Parse distinct labels into standards (standard_CONC) and samples (SAMPLE_1/DILUTION_FACTOR)
+	"""
+	labels = pl.Series("label", labels, dtype=pl.String)
+	return (
+		pl.DataFrame(labels)
+		.with_columns(
+			pl.col("label").str.contains("standard_\\d{1,4}", literal=False).alias("is_standard"),
+			pl.col("label").str.split("standard_").list.get(1, null_on_oob=True).cast(pl.Float64, strict=False).alias("conc"),
+			pl.col("label").str.split("_1/").list.to_struct(fields=["sample", "dilution_factor"], upper_bound=2),
+		)
+		.unnest("label")
+		.with_columns(pl.col("dilution_factor").cast(pl.Int64, strict=False))
+	)
+
+def plate_tables(plate):
+	"""
+	Get a plate's blank-subtracted standards (conc, value, well) and samples (sample, dilution_factor, value, well)
+	"""
+	# Wells in column-major order, as the plate reader lists them
+	codes = plate["codes"].ravel(order="F")
+	values = plate["values"].ravel(order="F")
+	wells = well_names(plate["codes"].shape).ravel(order="F")
+
+	labelled = codes >= 0
+	codes, values, wells = codes[labelled], values[labelled], wells[labelled]
+
+	# Mean blank replicates and subtract blank
+	blank = np.flatnonzero(plate["labels"] == "standard_0")
+	if len(blank) > 0 and not np.isnan(values[codes == blank[0]]).all():
+		values = values - np.nanmean(values[codes == blank[0]])
+
+	parsed = parse_labels(plate["labels"])
+	is_standard = parsed.get_column("is_standard").to_numpy()[codes]
+
+	stands = (
+		pl.DataFrame({
+			"conc": parsed.get_column("conc").to_numpy()[codes[is_standard]],
+			"value": values[is_standard],
+			"well": wells[is_standard],
+		})
+		.sort(by="conc")
+	)
+	samples = pl.DataFrame({
+		"sample": parsed.get_column("sample").gather(codes[~is_standard]),
+		"dilution_factor": parsed.get_column("dilution_factor").gather(codes[~is_standard]),
+		"value": values[~is_standard],
+		"well": wells[~is_standard],
+	})
+
+	return stands, samples
@@ -0,0 +1,84 @@
+import numpy as np
+
+"""
+Quadratic standard curves (concentration as a function of absorbance) for many plates at once. Each plate's points are
+a row of a (n_plates, max_points) array padded with NaN, and all the fits are solved in one batched least-squares call,
+including the bootstrap refits.
+"""
+
+def stack(arrays):
+	"""
+	Stack 1D arrays of different lengths into the rows of one array, padded with NaN
+	"""
+	stacked = np.full((len(arrays), max(len(array) for array in arrays)), np.nan)
+	for i, array in enumerate(arrays):
+		stacked[i, :len(array)] = array
+
+	return stacked
+
+def fit_quadratics(x, y):
+	"""
+	Least-squares fit y = c0 + c1*x + c2*x^2 along the last axis of x and y, ignoring NaN padding. Returns the
+	coefficients as an array of shape x.shape[:-1] + (3,)
+	"""
+	valid = ~(np.isnan(x) | np.isnan(y))
+
+	# Padded points become all-zero rows, which don't change the least-squares solution
+	vander = np.where(valid[..., None], np.stack([np.ones_like(x), x, x * x], axis=-1), 0)
+	y = np.where(valid, y, 0)
+
+	# Scale the columns to unit length, as polyfit does, to keep the fits well conditioned
+	scale = np.sqrt((vander * vander).sum(axis=-2))
+	scale[scale == 0] = 1
+
+	return (np.linalg.pinv(vander / scale[..., None, :]) @ y[..., None])[..., 0] / scale
+
+def predict(coef, x):
+	"""
+	Evaluate the quadratics in coef (shape (..., 3)) at x (shape (..., n_points)), broadcasting leading axes
+	"""
+	return coef[..., 0, None] + x * (coef[..., 1, None] + x * coef[..., 2, None])
+
+def bootstrap_quadratics(x, y, n_boot, rng):
+	"""
+	Refit each row of x and y n_boot times, each time on its points resampled with replacement, ignoring points where
+	either is NaN. Returns coefficients of shape (n_boot,) + x.shape[:-1] + (3,)
+	"""
+	# Move each row's valid points before its NaNs, which can be anywhere in the row (e.g. a saturated standard)
+	invalid = np.isnan(x) | np.isnan(y)
+	order = np.argsort(invalid, axis=-1, kind="stable")
+	x = np.take_along_axis(x, order, axis=-1)
+	y = np.take_along_axis(y, order, axis=-1)
+
+	n_points = (~invalid).sum(axis=-1)
+	max_points = x.shape[-1]
+
+	# Draw indices among each row's own points, and keep padding where the row has no point
+	idx = (rng.random((n_boot,) + x.shape) * n_points[..., None]).astype(np.int64)
+	padding = np.arange(max_points) >= n_points[..., None]
+
+	x_boot = np.where(padding, np.nan, np.take_along_axis(np.broadcast_to(x, idx.shape), idx, axis=-1))
+	y_boot = np.where(padding, np.nan, np.take_along_axis(np.broadcast_to(y, idx.shape), idx, axis=-1))
+
+	return fit_quadratics(x_boot, y_boot)
+
+def bootstrap_intervals(coef_boot, values, dilution_factors, groups, level=0.95):
+	"""
+	Percentile confidence intervals for each sample's diluted concentration and for the mean concentration of its
+	group, from the bootstrap fits in coef_boot (shape (n_boot, n_plates, 3)). values and dilution_factors are
+	(n_plates, max_samples) arrays padded with NaN, and groups holds the index of each sample's group within its plate.
+	Returns (conc_lower, conc_upper, group_mean_lower, group_mean_upper), each shaped like values
+	"""
+	conc = predict(coef_boot, values) * dilution_factors
+
+	# Mean each group within each plate with a one-hot group matrix
+	onehot = (groups[..., None] == np.arange(groups.max() + 1)).astype(np.float64)
+	onehot[np.isnan(values)] = 0
+	group_means = np.einsum("bps,psg->bpg", np.nan_to_num(conc), onehot) / np.maximum(onehot.sum(axis=1), 1)
+	sample_group_means = np.take_along_axis(group_means, np.broadcast_to(groups, conc.shape), axis=-1)
+
+	tails = [100 * (1 - level) / 2, 100 * (1 + level) / 2]
+	conc_lower, conc_upper = np.percentile(conc, tails, axis=0)
+	group_mean_lower, group_mean_upper = np.percentile(sample_group_means, tails, axis=0)
+
+	return conc_lower, conc_upper, group_mean_lower, group_mean_upper
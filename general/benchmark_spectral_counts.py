@@ -0,0 +1,151 @@
+import argparse
+import contextlib
+import io
+import numpy as np
+import os
+import polars as pl
+import tempfile
+
+from core_exports import PROFILES, print_stats, process_export_staged, process_exports
+from instrumentation import collect, stage
+
+"""
+Benchmark the spectral-count processing on synthetic Core peptide-protein map exports
+
+Usage: python benchmark_spectral_counts.py [--sizes N ...] [--out RESULTS_PATH] [generator options]
+
+For each size, generates an export with that many PSMs, then times and measures peak memory of each stage (scan,
+flagging, stats, filter, write, report) separately, followed by the whole of process_exports with the in-memory and
+streaming engines. Results are printed, and written as a TSV to RESULTS_PATH if given.
+"""
+
+AMINO_ACIDS = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+def random_peptides(n, rng, min_len=7, max_len=30):
+
+	# Fill a fixed-width byte matrix with residues and zero out everything past each peptide's length, so viewing the
+	# rows as fixed-width byte strings gives peptides of varying length
+	lens = rng.integers(min_len, max_len + 1, n)
+	residues = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), (n, max_len))]
+	residues[np.arange(max_len) >= lens[:, None]] = 0
+
+	return pl.Series(residues.view(f"S{max_len}").ravel()).cast(pl.String)
+
+def make_core_peptide_export(
+	path,
+	n_psms,
+	n_searches=10,
+	n_peptides=200_000,
+	n_proteins=20_000,
+	decoy_rate=0.01,
+	contaminant_rate=0.02,
+	parsimony_mix=(0.45, 0.2, 0.35),
+	seed=0,
+	chunk_size=1_000_000,
+):
+	"""
+	Write a synthetic Core peptide-protein map export with n_psms rows to path. decoy_rate and contaminant_rate are the
+	fractions of PSMs on decoy and contaminant proteins, and parsimony_mix is the fraction of PSMs with a
+	Peptide_parsimony of U, R and null. Rows are generated and appended in chunks, so the export can be larger than
+	memory.
+	"""
+	rng = np.random.default_rng(seed)
+
+	# Pools of peptide sequences and protein IDs to draw from
+	peptides = ("K." + random_peptides(n_peptides, rng) + ".R").alias("peptide_sequence")
+	n_decoys = max(1, int(n_proteins * decoy_rate))
+	n_contaminants = max(1, int(n_proteins * contaminant_rate))
+	n_real = n_proteins - n_decoys - n_contaminants
+	proteins = pl.concat([
+		pl.Series([f"sp|P{i:05d}|PROT{i}_HUMAN" for i in range(n_real)]),
+		pl.Series([f"##sp|P{i:05d}|PROT{i}_HUMAN" for i in range(n_decoys)]),
+		pl.Series([f"sp|C{i:05d}|CONT{i}_contaminant" for i in range(n_contaminants)]),
+	]).alias("ProteinID")
+
+	# Probability of drawing each protein, so that the requested fractions of PSMs are decoys and contaminants
+	protein_probs = np.concatenate([
+		np.full(n_real, (1 - decoy_rate - contaminant_rate) / n_real),
+		np.full(n_decoys, decoy_rate / n_decoys),
+		np.full(n_contaminants, contaminant_rate / n_contaminants),
+	])
+	protein_probs /= protein_probs.sum()
+
+	parsimony = pl.Series(["U", "R", None], dtype=pl.String)
+
+	with open(path, "wb") as handle:
+		for start in range(0, n_psms, chunk_size):
+			n = min(chunk_size, n_psms - start)
+			peptide_ids = rng.integers(0, n_peptides, n)
+
+			pl.DataFrame({
+				"SearchID": rng.integers(1, n_searches + 1, n),
+				"PeptideID": peptide_ids,
+				"ProteinID": proteins.gather(rng.choice(len(proteins), n, p=protein_probs)),
+				"peptide_sequence": peptides.gather(peptide_ids),
+				"Peptide_parsimony": parsimony.gather(rng.choice(3, n, p=parsimony_mix)),
+			}).write_csv(handle, separator="\t", include_header=start == 0)
+
+def benchmark(size, work_dir, results, generator_kwargs):
+
+	in_dir = os.path.join(work_dir, f"{size}_raw")
+	os.makedirs(in_dir, exist_ok=True)
+	path = os.path.join(in_dir, f"synthetic_{size}.tsv")
+
+	with collect(results, size=size):
+		with stage("generate") as record:
+			make_core_peptide_export(path, size, **generator_kwargs)
+			record["rows_out"] = size
+
+		counts = process_export_staged(
+			path,
+			f"synthetic_{size}",
+			os.path.join(work_dir, f"synthetic_{size}_processed.tsv"),
+			PROFILES["core_peptides"],
+		)
+
+		with contextlib.redirect_stdout(io.StringIO()):
+			print_stats([("core_peptides", row) for row in counts.iter_rows(named=True)])
+
+		# The whole pipeline as the scripts run it
+		for engine in ["in-memory", "streaming"]:
+			with stage(f"process_exports/{engine}", rows_in=size):
+				process_exports(
+					[("core_peptides", in_dir, os.path.join(work_dir, f"{size}_processed_{engine}"))],
+					engine=engine,
+					staged=False,
+				)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000, 50_000_000])
+	parser.add_argument("--searches", type=int, default=10)
+	parser.add_argument("--peptides", type=int, default=200_000)
+	parser.add_argument("--proteins", type=int, default=20_000)
+	parser.add_argument("--decoy-rate", type=float, default=0.01)
+	parser.add_argument("--contaminant-rate", type=float, default=0.02)
+	parser.add_argument("--parsimony-mix", type=float, nargs=3, default=[0.45, 0.2, 0.35], metavar=("U", "R", "NULL"))
+	parser.add_argument("--out")
+	args = parser.parse_args()
+
+	generator_kwargs = {
+		"n_searches": args.searches,
+		"n_peptides": args.peptides,
+		"n_proteins": args.proteins,
+		"decoy_rate": args.decoy_rate,
+		"contaminant_rate": args.contaminant_rate,
+		"parsimony_mix": args.parsimony_mix,
+	}
+
+	results = []
+	for size in args.sizes:
+		with tempfile.TemporaryDirectory() as work_dir:
+			benchmark(size, work_dir, results, generator_kwargs)
+
+	df = pl.DataFrame(results)
+
+	with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=1000):
+		print(df)
+
+	if args.out is not None:
+		df.write_csv(args.out, separator="\t")
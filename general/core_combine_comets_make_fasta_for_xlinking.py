@@ -4,16 +4,32 @@ import pyopenms as oms
 import sys
 import time
 
+from export_schemas import SCHEMAS
+from fasta_index import find_duplicates, load_offset_index, lookup, read_records
+from instrumentation import stage
+from table_io import read_table
+
 """
 Usage:
 
 python core_combine_comets_make_fasta_for_xlinking.py FULL_FASTA_PATH PROTEIN TABLE PATHS
+
+The FASTA isn't loaded whole. Its offset index (identifier to byte offset and length of each record) is saved next to it
+as FULL_FASTA_PATH.index.json, and only rebuilt when the FASTA changes, so later runs only read the proteins they need.
+
+Every protein missing from the FASTA is listed before exiting with an error, and identifiers with more than one entry
+in the FASTA are reported (all their entries are kept).
+
+Set DATASCRIPTS_INSTRUMENT to a file path (or "-" for stderr) to record the time and memory of each stage (reading
+each protein table, loading the FASTA index, extracting and storing the proteins) as JSON lines.
 """
 
 # Input is protein table(s) downloaded from protein map in Core, all will be combined
 dfs = []
 for res in sys.argv[2:]:
-	dfs.append(pl.read_csv(res, separator="\t"))
+	with stage("read_table", file=res) as record:
+		dfs.append(read_table(res, separator="\t", schema_overrides=SCHEMAS["core_proteins"]))
+		record["rows_out"] = dfs[-1].shape[0]
 
 df = (
 	pl.concat(dfs, how="vertical")
@@ -36,20 +52,33 @@ with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=10000, fmt_str_lengths=
 	print(df)
 
 full_fasta_path = sys.argv[1]
-full_fasta = []
-oms.FASTAFile().load(full_fasta_path, full_fasta)
+with stage("load_index", file=full_fasta_path) as record:
+	index = load_offset_index(full_fasta_path)
+	record["rows_out"] = len(index)
 
 xlink_fasta_path = f"from_comet_{time.strftime('%Y%m%d-%H%M%S')}.fasta"
 xlink_fasta = []
 
-for prot in df.get_column("protein_id"):
-	added = 0
-	for entry in full_fasta:
-		if entry.identifier == prot:
-			xlink_fasta.append(entry)
-			added += 1
+with stage("extract", file=full_fasta_path, rows_in=df.shape[0]) as record:
+	spans, missing, duplicated = lookup(index, df.get_column("protein_id"))
+	for identifier, description, sequence in read_records(full_fasta_path, spans):
+		entry = oms.FASTAEntry()
+		entry.identifier = identifier
+		entry.description = description
+		entry.sequence = sequence
+		xlink_fasta.append(entry)
+	record["rows_out"] = len(xlink_fasta)
+
+duplicates = find_duplicates(index)
+if len(duplicates) > 0:
+	print(f"{len(duplicates)} identifiers have more than one entry in {full_fasta_path}")
+for prot, count in duplicated.items():
+	print(f"{prot} has {count} entries, all added")
 
-	if added == 0:
-		raise ValueError(f"{prot} not found")
+if len(missing) > 0:
+	for prot in missing:
+		print(f"{prot} not found")
+	raise ValueError(f"{len(missing)} of {df.shape[0]} proteins not found in {full_fasta_path}")
 
-oms.FASTAFile().store(xlink_fasta_path, xlink_fasta)
+with stage("store", file=xlink_fasta_path, rows_in=len(xlink_fasta)):
+	oms.FASTAFile().store(xlink_fasta_path, xlink_fasta)
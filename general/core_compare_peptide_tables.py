@@ -2,12 +2,15 @@ import os
 import polars as pl
 import sys
 
+from export_schemas import SCHEMAS
+from table_io import scan_table
+
 dfs = []
 
 for path in sys.argv[1:]:
 
 	dfs.append(
-		pl.scan_csv(path, separator="\t")
+		scan_table(path, separator="\t", schema_overrides=SCHEMAS["core_peptides"])
 		.with_columns(pl.lit(os.path.basename(path)).alias("table"))
 		.select("ProteinID", "peptide_sequence", "table")
 		.unique()
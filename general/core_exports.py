@@ -0,0 +1,441 @@
+import glob
+import json
+import os
+import polars as pl
+
+from export_schemas import SCHEMAS
+from file_state import file_record, is_unchanged
+from instrumentation import stage
+from table_io import OUTPUT_FORMATS, sink_table
+
+"""
+Shared engine for processing tables exported from Core: mark and remove contaminant and decoy rows, write the filtered
+tables, and compute and print statistics on what was removed.
+
+Each kind of export is described by a profile in PROFILES, so adding a new export type only means adding a profile.
+"""
+
+# Subsets of rows each stat is computed over, as masks on the decoy and contaminant flags
+SUBSETS = {
+	"count": pl.repeat(True, pl.len()),
+	"decoy_count": pl.col("decoy"),
+	"contaminant_count": pl.col("contaminant"),
+	"real_count": ~pl.col("decoy") & ~pl.col("contaminant"),
+}
+
+# Stats for each export type, as (sort_order, stat_name, function of a subset mask returning an aggregation)
+PEPTIDE_STATS = [
+	# Number of successfully identified peptides (number of unique combinations of search ID and peptide ID)
+	(0, "successful_peptide_ids", lambda mask: pl.struct("SearchID", "PeptideID").filter(mask).n_unique()),
+
+	# Total PSMs
+	(1, "total_psms", lambda mask: mask.sum()),
+
+	# Picked PSMs
+	(2, "picked_psms", lambda mask: (mask & pl.col("Peptide_parsimony").is_not_null()).sum()),
+
+	# Unique PSMs
+	(3, "unique_psms", lambda mask: (mask & (pl.col("Peptide_parsimony") == "U")).sum()),
+
+	# Razor PSMs
+	(4, "razor_psms", lambda mask: (mask & (pl.col("Peptide_parsimony") == "R")).sum()),
+
+	# Number of unique peptides (number of unique values in sequence column)
+	(5, "unique_peptides", lambda mask: pl.col("peptide_sequence").filter(mask).n_unique()),
+]
+
+PROTEIN_STATS = [
+	# Protein count
+	(6, "proteins", lambda mask: mask.sum()),
+]
+
+SEARCH_PEPTIDE_STATS = [
+	# Total PSMs
+	(1, "total_psms", lambda mask: mask.sum()),
+
+	# Number of unique peptides (number of unique values in sequence column)
+	(5, "unique_peptides", lambda mask: pl.col("Peptide").filter(mask).n_unique()),
+]
+
+PROFILES = {
+	# Core>Browse Data>View Peptide-Protein Mapping>View>Protein Map Information>Download w/Peptides
+	"core_peptides": {
+		"schema": "core_peptides",
+		"protein_col": "ProteinID",
+		"separator": "\t",
+		"extension": "tsv",
+		"decoy": ("starts_with", "##"),
+		"contaminant": ("ends_with", "_contaminant"),
+		"stats": PEPTIDE_STATS,
+		"keep": pl.col("Peptide_parsimony").is_not_null(), # Only keep unique and Razor PSMs
+		"unique_col": None,
+		"output_name": "{basename}",
+	},
+
+	# Core>Browse Data>View Peptide-Protein Mapping>View>Protein Map Information>View Proteins>Download Table
+	"core_proteins": {
+		"schema": "core_proteins",
+		"protein_col": "protein_id",
+		"separator": "\t",
+		"extension": "tsv",
+		"decoy": ("starts_with", "##"),
+		"contaminant": ("ends_with", "_contaminant"),
+		"stats": PROTEIN_STATS,
+		"keep": None,
+		"unique_col": "protein_id",
+		"output_name": "{basename}",
+	},
+
+	# Core>Browse Data>Browse Search Data>View>Export peptide CSV table
+	"core_search_peptides": {
+		"schema": "core_search_peptides",
+		"protein_col": "Reference",
+		"separator": ",",
+		"extension": "csv",
+		"decoy": ("contains", "##"),
+		"contaminant": ("contains", "_contaminant"),
+		"stats": SEARCH_PEPTIDE_STATS,
+		"keep": None,
+		"unique_col": None,
+		"output_name": "{basename}_filtered",
+	},
+}
+
+def match_expr(col, match):
+	how, pattern = match
+
+	if how == "starts_with":
+		return pl.col(col).str.starts_with(pattern)
+	elif how == "ends_with":
+		return pl.col(col).str.ends_with(pattern)
+	elif how == "contains":
+		return pl.col(col).str.contains(pattern, literal=True)
+	else:
+		raise ValueError(f"Unknown match type {how}")
+
+def flag_export(df, profile):
+
+	# Mark the rows that are decoys and contaminants
+	return df.with_columns(
+		contaminant=match_expr(profile["protein_col"], profile["contaminant"]),
+		decoy=match_expr(profile["protein_col"], profile["decoy"]),
+	)
+
+def scan_export(path, profile):
+	return flag_export(
+		pl.scan_csv(path, separator=profile["separator"], schema_overrides=SCHEMAS[profile["schema"]]),
+		profile,
+	)
+
+def filter_export(df, profile):
+
+	# Filter out contaminants and decoys
+	df = (
+		df.filter(
+			~pl.col("contaminant"),
+			~pl.col("decoy"),
+		)
+		.drop("contaminant", "decoy")
+	)
+
+	if profile["keep"] is not None:
+		df = df.filter(profile["keep"])
+
+	return df
+
+def stats_query(df, profile, basenames):
+
+	# Compute every stat over every subset for every file in a single grouped aggregation
+	aggs = [
+		stat(mask).cast(pl.Int64).alias(f"{stat_name}/{subset_name}")
+		for _, stat_name, stat in profile["stats"]
+		for subset_name, mask in SUBSETS.items()
+	]
+
+	if profile["unique_col"] is not None:
+		aggs.append((pl.col(profile["unique_col"]).n_unique() == pl.len()).alias("unique_rows"))
+
+	# Files without rows have no group, so give them zero counts
+	return (
+		pl.LazyFrame({"basename": basenames}, schema={"basename": pl.String})
+		.join(df.group_by("basename").agg(aggs), on="basename", how="left")
+		.with_columns(
+			pl.col(f"{stat_name}/{subset_name}").fill_null(0)
+			for _, stat_name, _ in profile["stats"]
+			for subset_name in SUBSETS
+		)
+		.with_columns(pl.col("^unique_rows$").fill_null(True))
+	)
+
+def get_cached(manifest, manifest_dir, key, profile_name, out_path):
+
+	# Use the recorded stats only if the input is unchanged, the same output still exists, and the same stats were
+	# computed
+	entry = manifest.get(key)
+	if (
+		entry is None or
+		"stats" not in entry or
+		entry["profile"] != profile_name or
+		entry["output"] != os.path.relpath(out_path, manifest_dir) or
+		not os.path.exists(out_path)
+	):
+		return None
+
+	if any(
+		f"{stat_name}/{subset_name}" not in entry["stats"]
+		for _, stat_name, _ in PROFILES[profile_name]["stats"]
+		for subset_name in SUBSETS
+	):
+		return None
+
+	if not is_unchanged(os.path.join(manifest_dir, key), entry):
+		return None
+
+	return entry
+
+def process_export_staged(filename, basename, out_path, profile, engine="in-memory"):
+	"""
+	Process one export by collecting each stage (scan, flagging, stats, filter, write) separately, so each can be
+	measured on its own. Slower than the fused query process_exports normally runs. Returns the file's stats as a
+	one-row DataFrame.
+	"""
+	with stage("scan", file=filename, inputs=[filename]) as record:
+		df = pl.scan_csv(filename, separator=profile["separator"], schema_overrides=SCHEMAS[profile["schema"]]).collect(engine=engine)
+		record["rows_out"] = df.shape[0]
+
+	with stage("flagging", file=filename, rows_in=df.shape[0]) as record:
+		df = flag_export(df.lazy(), profile).collect(engine=engine)
+		record["rows_out"] = df.shape[0]
+
+	with stage("stats", file=filename, rows_in=df.shape[0]) as record:
+		counts = stats_query(df.lazy().with_columns(pl.lit(basename).alias("basename")), profile, [basename]).collect(engine=engine)
+		record["rows_out"] = counts.shape[0]
+
+	with stage("filter", file=filename, rows_in=df.shape[0]) as record:
+		df = filter_export(df.lazy(), profile).collect(engine=engine)
+		record["rows_out"] = df.shape[0]
+
+	with stage("write", file=filename, rows_in=df.shape[0]) as record:
+		sink_table(df.lazy(), out_path)
+		record["rows_out"] = df.shape[0]
+
+	return counts
+
+def process_exports(jobs, engine="in-memory", output_format="tsv", manifest_path=None, force=False, staged=False):
+	"""
+	Process every export in each (profile_name, in_dir, out_dir) job, writing the filtered tables in output_format (a
+	key of table_io.OUTPUT_FORMATS). Returns the stats of each file as a list of (profile_name, stats row) pairs.
+
+	All files go through one collect_all, so polars parallelizes across files and each input file is only scanned once.
+	If manifest_path is given, files that haven't changed since they were recorded there are skipped and their stats
+	are taken from the manifest, unless force is set.
+
+	If staged is set, each file is instead run through process_export_staged, to get per-stage measurements. That
+	loads each file whole, whatever the engine, so it's only for profiling.
+	"""
+
+	manifest = {}
+	if manifest_path is not None and os.path.exists(manifest_path) and not force:
+		with open(manifest_path, "r") as manifest_handle:
+			manifest = json.load(manifest_handle)
+
+	manifest_dir = os.path.dirname(manifest_path) if manifest_path is not None else None
+	new_manifest = {}
+
+	queries = []
+	sinks = []
+	staged_counts = []
+	rows = []
+	inputs = []
+
+	for profile_name, in_dir, out_dir in jobs:
+
+		profile = PROFILES[profile_name]
+
+		os.makedirs(out_dir, exist_ok=True)
+
+		# Scan each input file
+		scans = {}
+		for filename in sorted(glob.glob(os.path.join(in_dir, f"*.{profile['extension']}"))):
+
+			basename = os.path.basename(filename).rsplit(".", maxsplit=1)[0]
+			out_path = os.path.join(
+				out_dir,
+				f"{profile['output_name'].format(basename=basename)}.{OUTPUT_FORMATS[output_format]}",
+			)
+
+			if manifest_path is not None:
+
+				# Skip files that haven't changed since the last run
+				key = os.path.relpath(filename, manifest_dir)
+				entry = get_cached(manifest, manifest_dir, key, profile_name, out_path)
+				if entry is not None:
+					new_manifest[key] = entry
+					rows.append((profile_name, entry["stats"]))
+					continue
+
+				with stage("hash", file=filename, inputs=[filename]):
+					record = file_record(filename)
+
+				new_manifest[key] = {
+					"profile": profile_name,
+					"mtime_ns": record["mtime_ns"],
+					"size": record["size"],
+					"sha256": record["sha256"],
+					"output": os.path.relpath(out_path, manifest_dir),
+				}
+
+			scans[basename] = (filename, out_path)
+
+		if len(scans) == 0:
+			continue
+
+		filenames = {basename: filename for basename, (filename, _) in scans.items()}
+		inputs += filenames.values()
+
+		if staged:
+			staged_counts.append((
+				profile_name,
+				filenames,
+				pl.concat([
+					process_export_staged(filename, basename, out_path, profile, engine=engine)
+					for basename, (filename, out_path) in scans.items()
+				]),
+			))
+			continue
+
+		scans = {basename: (scan_export(filename, profile), out_path) for basename, (filename, out_path) in scans.items()}
+
+		# Stack all the files into one table, recording which file each row came from, to get the stats for every
+		# file from one query
+		queries.append((
+			profile_name,
+			filenames,
+			stats_query(
+				pl.concat(
+					[df.with_columns(pl.lit(basename).alias("basename")) for basename, (df, _) in scans.items()],
+					how="diagonal_relaxed",
+				),
+				profile=profile,
+				basenames=list(filenames),
+			),
+		))
+
+		for df, out_path in scans.values():
+			sinks.append(sink_table(filter_export(df, profile), out_path, lazy=True))
+
+	# Compute all the stats and write all the outputs together
+	results = []
+	if len(queries) > 0:
+		with stage("collect_all", inputs=inputs):
+			results = pl.collect_all([query for _, _, query in queries] + sinks, engine=engine)
+
+	for profile_name, filenames, counts in staged_counts + [
+		(profile_name, filenames, counts)
+		for (profile_name, filenames, _), counts in zip(queries, results)
+	]:
+		for row in counts.iter_rows(named=True):
+
+			if "unique_rows" in row and not row["unique_rows"]:
+				raise ValueError(f"Table {filenames[row['basename']]} has non-unique rows!!")
+
+			if manifest_path is not None:
+				new_manifest[os.path.relpath(filenames[row["basename"]], manifest_dir)]["stats"] = row
+
+			rows.append((profile_name, row))
+
+	# Record the stats of every file that's currently in the input dirs for the next run. Every processed file has a
+	# stats row, but an entry without one is left out rather than recorded as cached.
+	if manifest_path is not None:
+		with open(manifest_path, "w") as manifest_handle:
+			json.dump({key: entry for key, entry in new_manifest.items() if "stats" in entry}, manifest_handle, indent="\t")
+
+	return rows
+
+def format_col(coltype, max_col_width):
+	return pl.concat_str(
+		[
+			pl.col("stat_name"),
+			pl.lit(f" {coltype}: "),
+			pl.col(f"{coltype}_count").map_elements(lambda ct: f"{ct: >{max_col_width},}", return_dtype=pl.String),
+			pl.lit(" / "),
+			pl.col("count").map_elements(lambda ct: f"{ct: <{max_col_width},}", return_dtype=pl.String),
+			pl.lit(" ("),
+			pl.col(f"{coltype}_prop").map_elements(lambda prop: f"{prop:.2%}", return_dtype=pl.String),
+			pl.lit(")")
+		],
+		separator="",
+	)
+
+def print_stats(rows):
+	with stage("report", rows_in=len(rows)):
+		print_stats_table(rows)
+
+def print_stats_table(rows):
+
+	df_sort_order = []
+	df_basenames = []
+	df_stat_names = []
+	df_counts = []
+	df_decoy_counts = []
+	df_contaminant_counts = []
+	df_real_counts = []
+
+	for profile_name, counts in rows:
+		for sort_order, stat_name, _ in PROFILES[profile_name]["stats"]:
+			df_sort_order.append(sort_order)
+			df_basenames.append(counts["basename"])
+			df_stat_names.append(stat_name)
+
+			df_counts.append(counts[f"{stat_name}/count"])
+			df_decoy_counts.append(counts[f"{stat_name}/decoy_count"])
+			df_contaminant_counts.append(counts[f"{stat_name}/contaminant_count"])
+			df_real_counts.append(counts[f"{stat_name}/real_count"])
+
+	df_all = (
+		pl.DataFrame({
+			"basename": df_basenames,
+			"stat_name": df_stat_names,
+			"count": df_counts,
+			"decoy_count": df_decoy_counts,
+			"contaminant_count": df_contaminant_counts,
+			"real_count": df_real_counts,
+			"sort_order": df_sort_order,
+		})
+		.sort("basename", "sort_order")
+		.drop("sort_order")
+		.with_columns(
+			decoy_prop=pl.col("decoy_count") / pl.col("count"),
+			contaminant_prop=pl.col("contaminant_count") / pl.col("count"),
+			real_prop=pl.col("real_count") / pl.col("count"),
+		)
+	)
+
+	max_col_width = 9
+
+	df_all = (
+		df_all.with_columns(
+			decoy=format_col("decoy", max_col_width=max_col_width),
+			contaminant=format_col("contaminant", max_col_width=max_col_width),
+			real=format_col("real", max_col_width=max_col_width),
+		)
+		.select("basename", "real", "decoy", "contaminant")
+	)
+
+	for basename in sorted(df_all.get_column("basename").unique()):
+
+		sel = (
+			df_all.filter(pl.col("basename") == basename)
+		)
+
+		with pl.Config(
+			tbl_rows=-1,
+			tbl_cols=-1,
+			tbl_width_chars=1000,
+			fmt_str_lengths=1000,
+			tbl_cell_alignment="RIGHT",
+			tbl_hide_column_data_types=True,
+			tbl_hide_dataframe_shape=True,
+			tbl_hide_column_names=True,
+		):
+			print(sel)
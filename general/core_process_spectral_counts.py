@@ -1,7 +1,7 @@
-import glob
+import argparse
 import os
-import polars as pl
-import sys
+
+from core_exports import print_stats, process_exports
 
 """
 Takes peptide and protein output files from:
@@ -9,218 +9,46 @@ Core>Browse Data>View Peptide-Protein Mapping>View>Protein Map Information>Downl
 
 Remove contaminant and decoy sequences from output, and print some statistics
 
-Usage: python process.py BASE_DIR
+Usage: python process.py BASE_DIR [--streaming] [--force] [--format {tsv,parquet,ipc}] [--staged]
 
 BASE_DIR should contain two directories: peptides_raw and proteins_raw
-"""
-
-basedir = sys.argv[1]
-
-df_sort_order = []
-df_basenames = []
-df_types = []
-df_stat_names = []
-df_counts = []
-df_decoy_counts = []
-df_contaminant_counts = []
-df_real_counts = []
-
-def add_entry(sort_order, basename, type, stat_name, filter):
-
-	df_sort_order.append(sort_order)
-	df_basenames.append(basename)
-	df_types.append(type)
-	df_stat_names.append(stat_name)
-
-	df_counts.append(
-		filter(df)
-	)
-	df_decoy_counts.append(
-		filter(df.filter(pl.col("decoy")))
-	)
-	df_contaminant_counts.append(
-		filter(df.filter(pl.col("contaminant")))
-	)
-	df_real_counts.append(
-		filter(df.filter(~pl.col("decoy") & ~pl.col("contaminant")))
-	)
-
-for type in ["peptides", "proteins"]:
-
-	# Get input and output dirs
-	in_dir = os.path.join(basedir, type + "_raw")
-	out_dir = os.path.join(basedir, type + "_processed")
-
-	os.makedirs(out_dir, exist_ok=True)
-
-	# Set column names
-	if type == "peptides":
-		prot_col = "ProteinID"
-	elif type == "proteins":
-		prot_col = "protein_id"
-
-	# Get all the input files
-	filenames = sorted(glob.glob(os.path.join(in_dir, "*.tsv")))
-
-	for filename in filenames:
-
-		basename = os.path.basename(filename).rsplit(".", maxsplit=1)[0]
-
-		# Mark the rows that are decoys and contaminants
-		df = (
-			pl.scan_csv(filename, separator="\t")
-			.with_columns(
-				contaminant=pl.col(prot_col).str.ends_with("_contaminant"),
-				decoy=pl.col(prot_col).str.starts_with("##"),
-			)
-			.collect()
-		)
-
-		if type == "peptides":
 
-			# Number of successfully identified peptides (number of unique combinations of search ID and peptide ID)
-			add_entry(
-				sort_order=0,
-				basename=basename,
-				type=type,
-				stat_name="successful_peptide_ids",
-				filter=lambda df: df.n_unique(subset=["SearchID", "PeptideID"]),
-			)
+With --streaming, each input file is processed in batches by the streaming engine instead of being loaded into memory
+whole, so peak memory stays bounded for very large exports
 
-			# Total PSMs
-			add_entry(
-				sort_order=1,
-				basename=basename,
-				type=type,
-				stat_name="total_psms",
-				filter=lambda df: df.shape[0],
-			)
+The stats and outputs of each input file are recorded in BASE_DIR/spectral_counts_manifest.json, and on later runs
+files whose contents haven't changed are skipped and their stats are taken from the manifest. --force ignores the
+manifest and re-processes every file
 
-			# Picked PSMs
-			add_entry(
-				sort_order=2,
-				basename=basename,
-				type=type,
-				stat_name="picked_psms",
-				filter=lambda df: df.filter(pl.col("Peptide_parsimony").is_not_null()).shape[0],
-			)
+--format writes the processed tables as zstd-compressed Parquet or Arrow IPC instead of TSV, keeping their dtypes. The
+scripts that read processed tables accept any of these formats
 
-			# Unique PSMs
-			add_entry(
-				sort_order=3,
-				basename=basename,
-				type=type,
-				stat_name="unique_psms",
-				filter=lambda df: df.filter(pl.col("Peptide_parsimony") == "U").shape[0],
-			)
-
-			# Razor PSMs
-			add_entry(
-				sort_order=4,
-				basename=basename,
-				type=type,
-				stat_name="razor_psms",
-				filter=lambda df: df.filter(pl.col("Peptide_parsimony") == "R").shape[0],
-			)
-
-			# Number of unique peptides (number of unique values in sequence column)
-			add_entry(
-				sort_order=5,
-				basename=basename,
-				type=type,
-				stat_name="unique_peptides",
-				filter=lambda df: df.n_unique(subset="peptide_sequence"),
-			)
-
-		elif type == "proteins":
-
-			# Protein count
-			add_entry(
-				sort_order=6,
-				basename=basename,
-				type=type,
-				stat_name="proteins",
-				filter=lambda df: df.shape[0],
-			)
-
-			if df.n_unique("protein_id") != df.shape[0]:
-				raise ValueError(f"Protein table {filename} has non-unique rows!!")
-
-		# Filter out contaminants and decoys
-		df = (
-			df.filter(
-				~pl.col("contaminant"),
-				~pl.col("decoy"),
-			)
-			.drop("contaminant", "decoy")
-		)
-
-		# If it's the peptides file, only keep unique and Razor PSMs
-		if type == "peptides":
-			df = df.filter(pl.col("Peptide_parsimony").is_not_null())
-
-		df.write_csv(os.path.join(out_dir, f"{basename}.tsv"), separator="\t")
-
-def format_col(coltype, max_col_width):
-	return pl.concat_str(
-		[
-			pl.col("stat_name"),
-			pl.lit(f" {coltype}: "),
-			pl.col(f"{coltype}_count").map_elements(lambda ct: f"{ct: >{max_col_width},}", return_dtype=pl.String),
-			pl.lit(" / "),
-			pl.col("count").map_elements(lambda ct: f"{ct: <{max_col_width},}", return_dtype=pl.String),
-			pl.lit(" ("),
-			pl.col(f"{coltype}_prop").map_elements(lambda prop: f"{prop:.2%}", return_dtype=pl.String),
-			pl.lit(")")
-		],
-		separator="",
-	)
-
-df_all = (
-	pl.DataFrame({
-		"basename": df_basenames,
-		"type": df_types,
-		"stat_name": df_stat_names,
-		"count": df_counts,
-		"decoy_count": df_decoy_counts,
-		"contaminant_count": df_contaminant_counts,
-		"real_count": df_real_counts,
-		"sort_order": df_sort_order,
-	})
-	.sort("basename", "sort_order")
-	.drop("sort_order")
-	.with_columns(
-		decoy_prop=pl.col("decoy_count") / pl.col("count"),
-		contaminant_prop=pl.col("contaminant_count") / pl.col("count"),
-		real_prop=pl.col("real_count") / pl.col("count"),
-	)
-)
-
-max_col_width = 9
+Set DATASCRIPTS_INSTRUMENT to a file path (or "-" for stderr) to record the time and memory of each stage (hashing
+each input file, the one fused query over all of them, and the report) as JSON lines. With --staged, each stage of
+each input file (scan, flagging, stats, filter, write) is instead run and recorded separately, loading each file whole,
+so the run is slower and needs more memory, and --streaming only applies to the stages after the scan
+"""
 
-df_all = (
-	df_all.with_columns(
-		decoy=format_col("decoy", max_col_width=max_col_width),
-		contaminant=format_col("contaminant", max_col_width=max_col_width),
-		real=format_col("real", max_col_width=max_col_width),
-	)
-	.select("basename", "real", "decoy", "contaminant")
+parser = argparse.ArgumentParser()
+parser.add_argument("basedir")
+parser.add_argument("--streaming", action="store_true")
+parser.add_argument("--force", action="store_true")
+parser.add_argument("--format", choices=["tsv", "parquet", "ipc"], default="tsv")
+parser.add_argument("--staged", action="store_true")
+args = parser.parse_args()
+
+basedir = args.basedir
+
+rows = process_exports(
+	[
+		("core_peptides", os.path.join(basedir, "peptides_raw"), os.path.join(basedir, "peptides_processed")),
+		("core_proteins", os.path.join(basedir, "proteins_raw"), os.path.join(basedir, "proteins_processed")),
+	],
+	engine="streaming" if args.streaming else "in-memory",
+	output_format=args.format,
+	manifest_path=os.path.join(basedir, "spectral_counts_manifest.json"),
+	force=args.force,
+	staged=args.staged,
 )
 
-for basename in sorted(df_all.get_column("basename").unique()):
-
-	sel = (
-		df_all.filter(pl.col("basename") == basename)
-	)
-
-	with pl.Config(
-		tbl_rows=-1,
-		tbl_cols=-1,
-		tbl_width_chars=1000,
-		fmt_str_lengths=1000,
-		tbl_cell_alignment="RIGHT",
-		tbl_hide_column_data_types=True,
-		tbl_hide_dataframe_shape=True,
-		tbl_hide_column_names=True,
-	):
-		print(sel)
+print_stats(rows)
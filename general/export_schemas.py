@@ -0,0 +1,81 @@
+import polars as pl
+
+"""
+Pinned dtypes for the columns we use from Core, GoDig and GoDig Viewer exports. Pass these as schema_overrides when
+reading an export, so those columns aren't re-inferred on every read and can't fail on values that only show up late
+in a file (e.g. a float in a column whose first rows are all integers). Gene ID columns are categorical, since they
+have far fewer distinct values than rows. Core protein ID columns are strings: they're read from the largest exports
+and matched as strings, and reading them as categoricals made processing those exports slower.
+
+Columns that aren't listed here are still inferred.
+"""
+
+SCHEMAS = {
+	# Core>Browse Data>View Peptide-Protein Mapping>View>Protein Map Information>Download w/Peptides
+	"core_peptides": {
+		"SearchID": pl.Int64,
+		"PeptideID": pl.Int64,
+		"ProteinID": pl.String,
+		"peptide_sequence": pl.String,
+		"Peptide_parsimony": pl.String,
+	},
+
+	# Core>Browse Data>View Peptide-Protein Mapping>View>Protein Map Information>View Proteins>Download Table
+	"core_proteins": {
+		"protein_id": pl.String,
+		"assigned_peptides": pl.Int64,
+	},
+
+	# Core>Browse Data>Browse Search Data>View>Export peptide CSV table
+	"core_search_peptides": {
+		"Reference": pl.String,
+		"Peptide": pl.String,
+		"# XIons": pl.String,
+		"BinoScore": pl.Float64,
+	},
+
+	# GoDig *_Result.csv
+	"godig_result": {
+		"GeneSymbol": pl.Categorical,
+		"Peptide": pl.String,
+		"Precursor Int (Log10)": pl.Float64,
+		"MS2 IT": pl.Float64,
+		"MS3 IT": pl.Float64,
+		"Fraction of Fragments": pl.Float64,
+		"Quant 3": pl.Float64,
+	},
+
+	# GoDig target list CSV
+	"godig_targets": {
+		"GeneSymbol": pl.Categorical,
+		"Peptide": pl.String,
+		"z": pl.Int64,
+	},
+
+	# GoDig Viewer *_TargetTable.csv
+	"gdv_target_table": {
+		"GeneSymbol": pl.Categorical,
+		"Sequence": pl.String,
+		"MZ": pl.Float64,
+		"Z": pl.Int64,
+		"TotalSumSN": pl.Float64,
+		"NumPassSumSN": pl.Int64,
+		"NumIDSuccess": pl.Int64,
+		"NumMonitorScans": pl.Int64,
+	},
+
+	# GoDig spectral library CSV export
+	"speclib_csv": {
+		"gene": pl.Categorical,
+		"peptide": pl.String,
+		"prec_z": pl.Int64,
+	},
+
+	# GoDig spectral library XML (*_SpecLib.xml), LibPeptide and AveragedSpectrum attributes
+	"speclib_xml": {
+		"Sequence": pl.String,
+		"GeneSymbol": pl.Categorical,
+		"Charge": pl.Int64,
+		"CV": pl.Float64,
+	},
+}
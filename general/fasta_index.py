@@ -0,0 +1,103 @@
+import json
+import mmap
+import os
+import re
+
+from file_state import file_record, is_unchanged
+
+"""
+Look up FASTA entries by identifier through an index built once, rather than a scan of the whole FASTA per identifier.
+
+The offset index maps each identifier to the byte span of its records in the FASTA file, like a samtools .fai. It's
+saved next to the FASTA with the FASTA's checksum and only rebuilt when the FASTA changes. Records are then sliced
+straight out of the memory-mapped FASTA, so getting a few hundred proteins from a whole proteome only parses those
+few hundred.
+"""
+
+def find_duplicates(index):
+	"""
+	Get the number of entries of each identifier that has more than one
+	"""
+	return {identifier: len(positions) for identifier, positions in index.items() if len(positions) > 1}
+
+def lookup(index, identifiers):
+	"""
+	Get the positions (e.g. spans in an offset index) of all the entries of each identifier, in the order of
+	identifiers. Returns the positions, the identifiers that have no entries, and the number of entries of each
+	identifier that has more than one.
+	"""
+	found = []
+	missing = []
+	duplicated = {}
+	for identifier in identifiers:
+		positions = index.get(identifier, [])
+		if len(positions) == 0:
+			missing.append(identifier)
+		elif len(positions) > 1:
+			duplicated[identifier] = len(positions)
+
+		found += positions
+
+	return found, missing, duplicated
+
+def build_offset_index(fasta_path):
+	"""
+	Map each identifier to the [offset, length] in bytes of each of its records in the FASTA
+	"""
+	index = {}
+	with open(fasta_path, "rb") as fasta_handle, mmap.mmap(fasta_handle.fileno(), 0, access=mmap.ACCESS_READ) as fasta:
+		starts = [match.start() for match in re.finditer(rb"^>", fasta, re.MULTILINE)]
+		for start, end in zip(starts, starts[1:] + [len(fasta)]):
+			header_end = fasta.find(b"\n", start, end)
+			header = fasta[start + 1:header_end if header_end != -1 else end].split(maxsplit=1)
+			identifier = header[0].decode() if len(header) > 0 else ""
+			index.setdefault(identifier, []).append([start, end - start])
+
+	return index
+
+def load_offset_index(fasta_path, index_path=None):
+	"""
+	Get the offset index of the FASTA, from index_path (by default FASTA_PATH.index.json) if it was saved for the same
+	FASTA contents, otherwise building and saving it
+	"""
+	if index_path is None:
+		index_path = f"{fasta_path}.index.json"
+
+	saved = None
+	if os.path.exists(index_path):
+		with open(index_path, "r") as index_handle:
+			saved = json.load(index_handle)
+
+	if saved is not None:
+		mtime_ns = saved["mtime_ns"]
+		if is_unchanged(fasta_path, saved):
+
+			# Only the modification time changed, so save it to skip hashing next time
+			if saved["mtime_ns"] != mtime_ns:
+				with open(index_path, "w") as index_handle:
+					json.dump(saved, index_handle)
+
+			return saved["index"]
+
+	saved = {**file_record(fasta_path), "index": build_offset_index(fasta_path)}
+	with open(index_path, "w") as index_handle:
+		json.dump(saved, index_handle)
+
+	return saved["index"]
+
+def parse_record(record):
+	"""
+	Parse a FASTA record into (identifier, description, sequence) as pyopenms does: the header splits at its first
+	space or tab, tabs are removed from the description, and all whitespace is removed from the sequence
+	"""
+	header, _, sequence = record.partition(b"\n")
+	identifier, description = re.match(rb">(\S*)\s?(.*)", header.rstrip(b"\r"), re.DOTALL).groups()
+
+	return identifier.decode(), description.replace(b"\t", b"").decode(), re.sub(rb"\s+", b"", sequence).decode()
+
+def read_records(fasta_path, spans):
+	"""
+	Read and parse the records at each [offset, length] in spans from the memory-mapped FASTA
+	"""
+	with open(fasta_path, "rb") as fasta_handle, mmap.mmap(fasta_handle.fileno(), 0, access=mmap.ACCESS_READ) as fasta:
+		return [parse_record(fasta[offset:offset + length]) for offset, length in spans]
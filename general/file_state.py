@@ -0,0 +1,38 @@
+import hashlib
+import os
+
+"""
+Record a file's size, modification time and checksum, and later tell whether it still has the same contents, so
+outputs built from it (processed tables, indexes, caches) can be reused. An unchanged size and modification time are
+trusted without reading the file; otherwise the checksums are compared.
+"""
+
+def file_sha256(path):
+	sha = hashlib.sha256()
+	with open(path, "rb") as handle:
+		for chunk in iter(lambda: handle.read(1 << 20), b""):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+def file_record(path):
+	"""
+	Get the size, mtime_ns and sha256 of a file as a dict
+	"""
+	file_stat = os.stat(path)
+	return {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "sha256": file_sha256(path)}
+
+def is_unchanged(path, record):
+	"""
+	Whether the file at path still has the contents in record (from file_record). If only its modification time
+	changed, record's mtime_ns is updated, so the file isn't hashed again next time.
+	"""
+	file_stat = os.stat(path)
+	if file_stat.st_size != record["size"]:
+		return False
+
+	if file_stat.st_mtime_ns != record["mtime_ns"]:
+		if file_sha256(path) != record["sha256"]:
+			return False
+		record["mtime_ns"] = file_stat.st_mtime_ns
+
+	return True
@@ -0,0 +1,110 @@
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+"""
+Opt-in per-stage instrumentation for the data scripts.
+
+Set the DATASCRIPTS_INSTRUMENT environment variable to a file path (or "-" for stderr) and every instrumented stage
+appends one JSON line to it with the stage name, input file, wall time, CPU time, rows in/out, peak RSS, the size of
+the stage's input files and the bytes read/written by the process during the stage. For example:
+
+DATASCRIPTS_INSTRUMENT=stages.jsonl python core_process_spectral_counts.py BASE_DIR
+"""
+
+INSTRUMENT_PATH = os.environ.get("DATASCRIPTS_INSTRUMENT")
+
+# Lists that records are also appended to, with extra fields to add to each record, while inside collect()
+collectors = []
+
+def enabled():
+	return INSTRUMENT_PATH is not None or len(collectors) > 0
+
+def get_rss():
+	try:
+		with open("/proc/self/statm", "r") as statm:
+			return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except OSError:
+		# Peak rather than current RSS where /proc isn't available (KiB on Linux, bytes on macOS)
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def get_io():
+	"""
+	Bytes read and written by the process so far, or Nones where /proc isn't available. Only reads through read calls
+	are counted, not reads of memory-mapped files, which is how polars reads its inputs; see input_bytes.
+	"""
+	try:
+		with open("/proc/self/io", "r") as proc_io:
+			counters = dict(line.split(": ") for line in proc_io.read().splitlines())
+		return int(counters["rchar"]), int(counters["wchar"])
+	except OSError:
+		return None, None
+
+def write_record(record):
+	for results, fields in collectors:
+		results.append({**fields, **record})
+
+	if INSTRUMENT_PATH == "-":
+		print(json.dumps(record), file=sys.stderr)
+	elif INSTRUMENT_PATH is not None:
+		with open(INSTRUMENT_PATH, "a") as handle:
+			handle.write(json.dumps(record) + "\n")
+
+@contextlib.contextmanager
+def collect(results, **fields):
+	"""
+	Also append every record made inside this block to results, with fields added to each
+	"""
+	collectors.append((results, fields))
+	try:
+		yield results
+	finally:
+		collectors.remove((results, fields))
+
+@contextlib.contextmanager
+def stage(name, file=None, rows_in=None, inputs=None):
+	"""
+	Measure the enclosed block as one stage. Yields a dict the block can set rows_out (or any other field) in. inputs
+	are the paths of the files the stage reads, whose total size is recorded as input_bytes. Does nothing unless
+	instrumentation is enabled.
+	"""
+	record = {"stage": name, "file": file, "rows_in": rows_in, "rows_out": None}
+
+	if not enabled():
+		yield record
+		return
+
+	record["input_bytes"] = sum(os.path.getsize(path) for path in inputs) if inputs is not None else None
+
+	# Sample RSS in the background to catch the peak during the stage
+	peak = [get_rss()]
+	done = threading.Event()
+
+	def sample():
+		while not done.wait(0.005):
+			peak[0] = max(peak[0], get_rss())
+
+	sampler = threading.Thread(target=sample, daemon=True)
+	sampler.start()
+
+	read_start, written_start = get_io()
+	wall_start = time.perf_counter()
+	cpu_start = time.process_time()
+	try:
+		yield record
+	finally:
+		record["wall_s"] = time.perf_counter() - wall_start
+		record["cpu_s"] = time.process_time() - cpu_start
+		done.set()
+		sampler.join()
+		record["peak_rss_mb"] = max(peak[0], get_rss()) / 1e6
+
+		read_end, written_end = get_io()
+		record["bytes_read"] = read_end - read_start if read_start is not None else None
+		record["bytes_written"] = written_end - written_start if written_start is not None else None
+
+		write_record(record)
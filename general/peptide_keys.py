@@ -0,0 +1,28 @@
+import polars as pl
+
+"""
+One canonical key for a peptide, whichever tool wrote it: Core's flanking notation (K.PEPT*IDE.R), the filtered
+crosslink tables, and GoDig and GoDig Viewer Peptide/Sequence columns all map to the bare residues (PEPTIDE).
+Modifications are dropped, whether as bracketed masses or names (M[+15.995], M(Oxidation)), symbols (M*) or lowercase
+terminal markers (n[230]), and so are flanking residues. Only uppercase residues are kept.
+
+peptide_key interns the canonical sequences as a categorical, so tables keyed with it are joined and grouped on the
+categorical's integer codes rather than by comparing strings.
+"""
+
+def canonical_peptide(expr):
+	"""
+	Canonical residue sequence of the peptides in a string expression, e.g. pl.col("peptide_sequence")
+	"""
+	return (
+		expr
+		.str.replace_all(r"\[[^\]]*\]|\([^)]*\)|\{[^}]*\}", "")
+		.str.replace(r"^.?\.(.*)\..?$", "$1")
+		.str.replace_all("[^A-Z]", "")
+	)
+
+def peptide_key(expr):
+	"""
+	canonical_peptide() as an interned categorical
+	"""
+	return canonical_peptide(expr).cast(pl.Categorical)
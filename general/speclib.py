@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import polars as pl
+import time
+
+from xml.parsers import expat
+
+from export_schemas import SCHEMAS
+from file_state import file_record, is_unchanged
+
+"""
+Read GoDig spectral library XMLs (*_SpecLib.xml) incrementally. The library is streamed through an event-driven XML
+parser a chunk at a time, keeping only the attributes of each LibPeptide and AveragedSpectrum, so memory stays
+constant however large the library is, apart from the table being built. Attributes are read by name, so their order
+and the whitespace between them don't matter.
+
+load_speclib caches each parsed library (XML or GoDig CSV export) as Parquet, so it's only parsed once. The cache is
+the directory DATASCRIPTS_SPECLIB_CACHE (by default ~/.cache/datascripts/speclib), with a manifest recording the
+source path, size, modification time and checksum of each library. A cached table is used while its source is
+unchanged, and the least recently used tables are evicted once the cache is bigger than
+DATASCRIPTS_SPECLIB_CACHE_BYTES (by default 2 GiB).
+"""
+
+CACHE_DIR = os.environ.get(
+	"DATASCRIPTS_SPECLIB_CACHE",
+	os.path.join(os.path.expanduser("~"), ".cache", "datascripts", "speclib"),
+)
+CACHE_BYTES = int(os.environ.get("DATASCRIPTS_SPECLIB_CACHE_BYTES", 2 << 30))
+
+def local_name(tag):
+	return tag.rsplit("}", maxsplit=1)[-1]
+
+def iter_speclib(path, chunk_size=1 << 20):
+	"""
+	Yield one dict per AveragedSpectrum with all the attributes of the spectrum (e.g. Charge, CV) and of its LibPeptide
+	(e.g. Sequence, GeneSymbol). Spectrum attributes with the same name as a peptide attribute are prefixed with
+	"Spectrum". A LibPeptide with no spectra gives one dict of its own attributes.
+	"""
+	# Only the attributes of LibPeptide and AveragedSpectrum are kept; no tree is built, so peaks are never stored
+	state = {"peptide": None, "n_spectra": 0}
+	rows = []
+
+	def start_element(name, attrs):
+		tag = local_name(name)
+		if tag == "LibPeptide":
+			state["peptide"] = attrs
+			state["n_spectra"] = 0
+		elif tag == "AveragedSpectrum" and state["peptide"] is not None:
+			peptide = state["peptide"]
+			state["n_spectra"] += 1
+			rows.append({**peptide, **{f"Spectrum{key}" if key in peptide else key: value for key, value in attrs.items()}})
+
+	def end_element(name):
+		if local_name(name) == "LibPeptide":
+			if state["n_spectra"] == 0:
+				rows.append(state["peptide"])
+			state["peptide"] = None
+
+	parser = expat.ParserCreate(namespace_separator="}")
+	parser.StartElementHandler = start_element
+	parser.EndElementHandler = end_element
+
+	with open(path, "rb") as speclib_handle:
+		while True:
+			chunk = speclib_handle.read(chunk_size)
+			parser.Parse(chunk, len(chunk) == 0)
+
+			yield from rows
+			rows.clear()
+
+			if len(chunk) == 0:
+				break
+
+def read_speclib(path, batch_size=100_000):
+	"""
+	Read a spectral library XML into a table with one row per spectrum, as from iter_speclib(), with the attributes in
+	SCHEMAS["speclib_xml"] cast to their dtypes and any others kept as strings. Rows are converted to columns in
+	batches of batch_size.
+	"""
+	schema = SCHEMAS["speclib_xml"]
+
+	def to_frame(rows):
+		if len(rows) == 0:
+			return pl.DataFrame(schema=schema)
+
+		df = pl.from_dicts(rows, infer_schema_length=None)
+		return df.with_columns(pl.col(column).cast(dtype) for column, dtype in schema.items() if column in df.columns)
+
+	batches = []
+	rows = []
+	for row in iter_speclib(path):
+		rows.append(row)
+		if len(rows) == batch_size:
+			batches.append(to_frame(rows))
+			rows = []
+
+	if len(rows) > 0 or len(batches) == 0:
+		batches.append(to_frame(rows))
+
+	return pl.concat(batches, how="diagonal_relaxed")
+
+def read_speclib_csv(path):
+	"""
+	Read a GoDig spectral library CSV export
+	"""
+	return pl.read_csv(path, schema_overrides=SCHEMAS["speclib_csv"])
+
+def load_speclib(path, cache_dir=None, max_bytes=None):
+	"""
+	Get a spectral library (*.xml, or a *.csv export) as a table, from the cache if it was cached for the same contents,
+	otherwise parsing it with read_speclib or read_speclib_csv and caching it
+	"""
+	cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+	max_bytes = CACHE_BYTES if max_bytes is None else max_bytes
+	manifest_path = os.path.join(cache_dir, "manifest.json")
+
+	manifest = {}
+	if os.path.exists(manifest_path):
+		with open(manifest_path, "r") as manifest_handle:
+			manifest = json.load(manifest_handle)
+
+	# Keyed by path, so a changed library replaces its old table
+	key = os.path.abspath(path)
+	entry = manifest.get(key)
+
+	df = None
+	if entry is not None and os.path.exists(os.path.join(cache_dir, entry["table"])) and is_unchanged(path, entry):
+		df = pl.read_parquet(os.path.join(cache_dir, entry["table"]))
+
+	if df is None:
+		df = read_speclib_csv(path) if path.lower().endswith(".csv") else read_speclib(path)
+
+		table = hashlib.sha256(key.encode()).hexdigest()[:16] + ".parquet"
+		os.makedirs(cache_dir, exist_ok=True)
+		df.write_parquet(os.path.join(cache_dir, table), compression="zstd")
+
+		entry = {
+			"table": table,
+			"bytes": os.path.getsize(os.path.join(cache_dir, table)),
+			**file_record(path),
+			"rows": df.shape[0],
+			"columns": df.columns,
+		}
+
+	entry["last_used"] = time.time()
+	manifest[key] = entry
+
+	# Evict the least recently used tables, other than this one, until the cache fits
+	total = sum(cached["bytes"] for cached in manifest.values())
+	for cached_key, cached in sorted(manifest.items(), key=lambda item: item[1]["last_used"]):
+		if total <= max_bytes:
+			break
+		if cached_key == key:
+			continue
+
+		if os.path.exists(os.path.join(cache_dir, cached["table"])):
+			os.remove(os.path.join(cache_dir, cached["table"]))
+		total -= cached["bytes"]
+		del manifest[cached_key]
+
+	with open(manifest_path, "w") as manifest_handle:
+		json.dump(manifest, manifest_handle, indent="\t")
+
+	return df
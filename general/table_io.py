@@ -0,0 +1,59 @@
+import glob
+import polars as pl
+
+"""
+Read and write tables as TSV/CSV, Parquet or Arrow IPC, chosen by file extension, so scripts that consume processed
+tables accept any of the formats transparently.
+"""
+
+# File extension of each output format
+OUTPUT_FORMATS = {
+	"tsv": "tsv",
+	"parquet": "parquet",
+	"ipc": "arrow",
+}
+
+# In order of preference, when the same table exists in more than one format
+TABLE_EXTENSIONS = ["parquet", "arrow", "ipc", "feather", "tsv", "csv"]
+
+def get_extension(path):
+	return path.rsplit(".", maxsplit=1)[-1].lower()
+
+def scan_table(path, **csv_kwargs):
+	ext = get_extension(path)
+	if ext == "parquet":
+		return pl.scan_parquet(path)
+	elif ext in ["arrow", "ipc", "feather"]:
+		return pl.scan_ipc(path)
+	else:
+		csv_kwargs.setdefault("separator", "\t" if ext == "tsv" else ",")
+		return pl.scan_csv(path, **csv_kwargs)
+
+def read_table(path, **csv_kwargs):
+	return scan_table(path, **csv_kwargs).collect()
+
+def sink_table(df, path, lazy=False):
+	"""
+	Write a LazyFrame to path in the format given by its extension. Parquet and IPC outputs are zstd compressed. With
+	lazy=True, return the sink as a query to pass to pl.collect_all instead of running it.
+	"""
+	ext = get_extension(path)
+	if ext == "parquet":
+		return df.sink_parquet(path, compression="zstd", lazy=lazy)
+	elif ext in ["arrow", "ipc", "feather"]:
+		return df.sink_ipc(path, compression="zstd", lazy=lazy)
+	else:
+		return df.sink_csv(path, separator="\t" if ext == "tsv" else ",", lazy=lazy)
+
+def glob_tables(pattern):
+	"""
+	Get the paths matching pattern followed by any table extension, e.g. glob_tables("filtered_peps/*_filtered"). A
+	table written in more than one format (e.g. by reruns of process_exports with different --format) is only returned
+	once, in the first of its formats in TABLE_EXTENSIONS.
+	"""
+	paths = {}
+	for ext in TABLE_EXTENSIONS:
+		for path in glob.glob(f"{pattern}.{ext}"):
+			paths.setdefault(path[:-len(ext) - 1], path)
+
+	return sorted(paths.values())
@@ -0,0 +1,209 @@
+import argparse
+import heapq
+import numpy as np
+import polars as pl
+import sys
+
+from export_schemas import SCHEMAS
+from peptide_keys import peptide_key
+from table_io import read_table
+
+"""
+Pick N GoDig targets from a pool of candidates (e.g. GoDig Viewer target tables or target lists) under constraints
+
+Usage: python target_selection.py CANDIDATES_PATH [CANDIDATES_PATH ...] -n N --out OUT_PATH [--score COL [COL ...]]
+	[--min COL=VALUE ...] [--gene-cap K] [--mz-bins N] [--no-charge-balance] [--balance {even,proportional}]
+	[--include LIST_PATH] [--exclude LIST_PATH]
+
+Candidates are split into strata by m/z bin (N equal-count bins of MZ) and charge, and targets are taken greedily:
+each pick is the best scoring remaining candidate of the stratum that is furthest below its share, skipping genes
+that already have --gene-cap targets. With --balance even every stratum gets the same share, as far as it has the
+candidates, and with --balance proportional each stratum's share follows its number of candidates. Candidates are
+ranked by the --score columns, descending, in order (e.g. --score NumIDSuccess TotalSumSN), skipping any the
+candidates don't have, and any --min COL=VALUE drops candidates below VALUE first. Candidates in the --include list
+are always taken, whatever their scores, and those in the --exclude list never are; --include entries that match no
+candidate are reported. The lists match on the peptide's canonical key (see peptide_keys.py), and on z too if they
+have it.
+
+Candidates with the same peptide and z in several inputs are merged, keeping the best scoring row.
+"""
+
+def with_peptide_key(df):
+	return df.with_columns(peptide_key(pl.col("Peptide")).alias("peptide_key"))
+
+def match_keys(df, targets):
+	if "z" in targets.columns and "z" in df.columns and targets.get_column("z").null_count() < targets.shape[0]:
+		return ["peptide_key", "z"]
+	return ["peptide_key"]
+
+def prepare_candidates(df, score_cols, min_scores=None, include=None, exclude=None):
+	"""
+	Normalize GoDig Viewer columns (Sequence, Z) to target list ones (Peptide, z), mark the candidates in include, drop
+	excluded candidates and low scoring ones that aren't included, and keep the best row of each peptide and z. Score
+	columns the candidates don't have are skipped. Returns the candidates sorted best first, with peptide_key and
+	included columns, and the entries of include that match no candidate.
+	"""
+	df = with_peptide_key(df.rename({old: new for old, new in [("Sequence", "Peptide"), ("Z", "z")] if old in df.columns}))
+
+	unmatched = None
+	if include is not None:
+		include = with_peptide_key(include)
+		keys = match_keys(df, include)
+		df = df.with_columns(pl.struct(keys).is_in(include.select(pl.struct(keys)).to_series().implode()).alias("included"))
+		unmatched = include.join(df, on=keys, how="anti").drop("peptide_key")
+	else:
+		df = df.with_columns(pl.lit(False).alias("included"))
+
+	for col, min_score in (min_scores or {}).items():
+		df = df.filter((pl.col(col) >= min_score) | pl.col("included"))
+
+	if exclude is not None:
+		exclude = with_peptide_key(exclude)
+		df = df.join(exclude, on=match_keys(df, exclude), how="anti")
+
+	# Ties broken by peptide, so the selection doesn't depend on input order
+	score_cols = [col for col in score_cols if col in df.columns]
+	df = (
+		df
+		.sort(score_cols + ["Peptide"], descending=[True] * len(score_cols) + [False], nulls_last=True)
+		.unique(subset=[col for col in ["peptide_key", "z"] if col in df.columns], keep="first", maintain_order=True)
+	)
+
+	return df, unmatched
+
+def strata(df, mz_bins=4, charge_balance=True):
+	"""
+	Index of each candidate's stratum: its bin among mz_bins equal-count bins of MZ, crossed with its charge
+	"""
+	keys = []
+	if mz_bins > 1 and "MZ" in df.columns:
+		keys.append(pl.col("MZ").qcut(mz_bins, allow_duplicates=True).to_physical())
+	if charge_balance and "z" in df.columns:
+		keys.append(pl.col("z"))
+
+	if len(keys) == 0:
+		return np.zeros(df.shape[0], dtype=np.int64)
+
+	return df.select(pl.struct(keys).rank("dense") - 1).to_series().to_numpy().astype(np.int64)
+
+def select_targets(df, n, stratum, gene_cap=None, balance="even"):
+	"""
+	Greedily select n rows of df, which is sorted best first, spreading them over the strata (stratum holds each row's
+	index) and taking at most gene_cap per GeneSymbol. Rows marked in an included column are taken first, regardless
+	of the caps. Returns a boolean mask of the selected rows.
+	"""
+	if "included" in df.columns:
+		selected = df.get_column("included").to_numpy().copy()
+	else:
+		selected = np.zeros(df.shape[0], dtype=bool)
+
+	# Without genes, every row is its own gene
+	genes = df.get_column("GeneSymbol").cast(pl.String).to_numpy() if "GeneSymbol" in df.columns else np.arange(df.shape[0])
+	gene_counts = {}
+	for gene in genes[selected]:
+		gene_counts[gene] = gene_counts.get(gene, 0) + 1
+
+	n_strata = int(stratum.max(initial=-1)) + 1
+	sizes = np.bincount(stratum, minlength=n_strata)
+	weights = np.ones(n_strata) if balance == "even" else sizes / max(sizes.sum(), 1)
+	taken = np.bincount(stratum[selected], minlength=n_strata).astype(np.float64)
+
+	# Each stratum's rows best first, with a pointer to the next one to consider
+	members = np.split(np.argsort(stratum, kind="stable"), np.cumsum(sizes)[:-1])
+	pointers = [0] * n_strata
+
+	def next_row(s):
+		while pointers[s] < len(members[s]):
+			row = members[s][pointers[s]]
+			if not selected[row] and (gene_cap is None or gene_counts.get(genes[row], 0) < gene_cap):
+				return row
+			pointers[s] += 1
+		return None
+
+	# Heap of (targets taken relative to share, rank of the stratum's next row, stratum)
+	heap = []
+	for s in range(n_strata):
+		row = next_row(s)
+		if row is not None:
+			heap.append((taken[s] / weights[s], row, s))
+	heapq.heapify(heap)
+
+	n_selected = int(selected.sum())
+	while n_selected < n and len(heap) > 0:
+		_, row, s = heapq.heappop(heap)
+
+		# The row may have been capped out since it was pushed
+		if next_row(s) != row:
+			row = next_row(s)
+			if row is not None:
+				heapq.heappush(heap, (taken[s] / weights[s], row, s))
+			continue
+
+		selected[row] = True
+		gene_counts[genes[row]] = gene_counts.get(genes[row], 0) + 1
+		taken[s] += 1
+		n_selected += 1
+
+		row = next_row(s)
+		if row is not None:
+			heapq.heappush(heap, (taken[s] / weights[s], row, s))
+
+	return selected
+
+def parse_min(arg):
+	col, _, value = arg.partition("=")
+	return col, float(value)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("candidates_paths", nargs="+")
+	parser.add_argument("-n", type=int, required=True)
+	parser.add_argument("--out", required=True)
+	parser.add_argument("--score", nargs="+", default=["TotalSumSN"])
+	parser.add_argument("--min", type=parse_min, nargs="+", default=[])
+	parser.add_argument("--gene-cap", type=int)
+	parser.add_argument("--mz-bins", type=int, default=4)
+	parser.add_argument("--no-charge-balance", action="store_true")
+	parser.add_argument("--balance", choices=["even", "proportional"], default="even")
+	parser.add_argument("--include")
+	parser.add_argument("--exclude")
+	args = parser.parse_args()
+
+	schema = {**SCHEMAS["gdv_target_table"], **SCHEMAS["godig_targets"]}
+	df = pl.concat(
+		[read_table(path, schema_overrides=schema) for path in args.candidates_paths],
+		how="diagonal_relaxed",
+	)
+
+	include, exclude = [
+		read_table(path, schema_overrides=SCHEMAS["godig_targets"]) if path is not None else None
+		for path in [args.include, args.exclude]
+	]
+
+	for col in args.score:
+		if col not in df.columns:
+			print(f"Candidates have no {col} column, so it isn't used to rank them", file=sys.stderr)
+
+	df, unmatched = prepare_candidates(df, args.score, min_scores=dict(args.min), include=include, exclude=exclude)
+	if unmatched is not None and unmatched.shape[0] > 0:
+		with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=1000, fmt_str_lengths=1000):
+			print(f"{unmatched.shape[0]} --include entries match no candidate:\n{unmatched}", file=sys.stderr)
+
+	selected = select_targets(
+		df,
+		args.n,
+		strata(df, mz_bins=args.mz_bins, charge_balance=not args.no_charge_balance),
+		gene_cap=args.gene_cap,
+		balance=args.balance,
+	)
+
+	if selected.sum() < args.n:
+		print(f"Only {selected.sum()} of {args.n} targets could be selected under the constraints", file=sys.stderr)
+
+	(
+		df.filter(pl.Series(selected))
+		.select("GeneSymbol", "Peptide", "z")
+		.sort("GeneSymbol", "Peptide", "z")
+		.write_csv(args.out, quote_style="non_numeric")
+	)
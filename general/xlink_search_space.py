@@ -0,0 +1,248 @@
+import argparse
+import numpy as np
+import polars as pl
+
+from fasta_index import build_offset_index, read_records
+
+"""
+Estimate the size of a crosslink search space from a FASTA, e.g. one made by
+core_combine_comets_make_fasta_for_xlinking.py, before running the search
+
+Usage: python xlink_search_space.py FASTA_PATH [FASTA_PATH ...] [--enzyme ENZYME] [--missed-cleavages N]
+	[--min-length N] [--max-length N] [--link-residues RESIDUES] [--no-nterm] [--linker LINKER] [--ppm PPM]
+	[--out RESULTS_PATH]
+
+Every protein is digested in silico, all at once as one array of residues. Linkable peptides are those with at least
+one link site: a link residue (K by default) that isn't the peptide's C-terminal cleavage site, since a crosslinked
+lysine isn't cleaved, or the protein N-terminus unless --no-nterm. For each FASTA, prints the number of proteins,
+peptides, unique peptides, unique linkable peptides and their link sites, the number of linkable peptide pairs and
+link site pairs (including pairs of a peptide with itself), and the mean number of candidate pairs whose crosslinked
+mass is within PPM of each pair's, as an estimate of the search cost per spectrum. Results are written as a TSV to
+RESULTS_PATH if given.
+"""
+
+# Residues each enzyme cleaves after, and residues that block cleavage when they come next
+ENZYMES = {
+	"trypsin": ("KR", "P"),
+	"trypsin/p": ("KR", ""),
+	"lys-c": ("K", ""),
+	"arg-c": ("R", "P"),
+	"glu-c": ("E", "P"),
+	"chymotrypsin": ("FWY", "P"),
+}
+
+# Monoisotopic residue masses
+RESIDUE_MASSES = {
+	"G": 57.02146, "A": 71.03711, "S": 87.03203, "P": 97.05276, "V": 99.06841, "T": 101.04768, "C": 103.00919,
+	"L": 113.08406, "I": 113.08406, "N": 114.04293, "D": 115.02694, "Q": 128.05858, "K": 128.09496, "E": 129.04259,
+	"M": 131.04049, "H": 137.05891, "F": 147.06841, "U": 150.95364, "R": 156.10111, "Y": 163.06333, "W": 186.07931,
+	"O": 237.14773,
+}
+WATER_MASS = 18.01056
+
+# Mass added by each crosslinker
+LINKERS = {
+	"dss": 138.06808,
+	"bs3": 138.06808,
+	"dsso": 158.00376,
+	"dsbu": 196.08479,
+}
+
+def residue_mask(residues, letters):
+	return np.isin(residues, np.frombuffer(letters.encode(), dtype=np.uint8))
+
+def encode(sequences):
+	"""
+	Concatenate the sequences into one uint8 array of residues, returning it with the start and end of each sequence
+	"""
+	lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+	ends = np.cumsum(lengths)
+	return np.frombuffer("".join(sequences).encode(), dtype=np.uint8), ends - lengths, ends
+
+def digest(sequences, enzyme="trypsin", missed_cleavages=2, min_length=6, max_length=40):
+	"""
+	Digest the sequences, returning the residues, starts and ends from encode() and a DataFrame of every peptide's
+	protein, start and end in the residues, and number of missed cleavages
+	"""
+	residues, starts, ends = encode(sequences)
+	cut_after, blocked_by = ENZYMES[enzyme]
+
+	is_cut = residue_mask(residues, cut_after)
+	is_cut[:-1] &= ~residue_mask(residues[1:], blocked_by)
+
+	# Each protein's last residue is already the end of a peptide
+	is_cut[ends[ends > starts] - 1] = False
+
+	# Peptides run between consecutive boundaries: protein starts and the residues after cleavage sites. With missed
+	# cleavages, they run to the boundary k + 1 further on, as long as it's still in the same protein
+	boundaries = np.unique(np.concatenate([starts, np.flatnonzero(is_cut) + 1, [len(residues)]]))
+	protein = np.searchsorted(starts, boundaries[:-1], side="right") - 1
+
+	peptides = []
+	for missed in range(missed_cleavages + 1):
+		peptide_starts = boundaries[:len(boundaries) - 1 - missed]
+		peptide_ends = boundaries[1 + missed:]
+		peptide_proteins = protein[:len(peptide_starts)]
+		peptides.append(pl.DataFrame(
+			{
+				"protein": peptide_proteins,
+				"start": peptide_starts,
+				"end": peptide_ends,
+				"missed_cleavages": missed,
+			},
+			schema={"protein": pl.Int64, "start": pl.Int64, "end": pl.Int64, "missed_cleavages": pl.Int64},
+		).filter(pl.Series(peptide_ends <= ends[peptide_proteins], dtype=pl.Boolean)))
+
+	peptides = (
+		pl.concat(peptides)
+		.filter(pl.col("end") - pl.col("start") >= min_length, pl.col("end") - pl.col("start") <= max_length)
+	)
+
+	return residues, starts, ends, peptides
+
+def annotate_peptides(residues, starts, ends, peptides, link_residues="K", nterm=True):
+	"""
+	Add each peptide's sequence, monoisotopic mass (null if it has unknown residues) and number of link sites
+	"""
+	peptide_starts = peptides.get_column("start").to_numpy()
+	peptide_ends = peptides.get_column("end").to_numpy()
+	peptide_proteins = peptides.get_column("protein").to_numpy()
+
+	# Sums over each peptide from cumulative sums over all the residues
+	def peptide_sums(per_residue):
+		cumulative = np.concatenate([[0], np.cumsum(per_residue)])
+		return cumulative[peptide_ends] - cumulative[peptide_starts]
+
+	masses = np.zeros(256)
+	masses[np.frombuffer("".join(RESIDUE_MASSES).encode(), dtype=np.uint8)] = list(RESIDUE_MASSES.values())
+	unknown = masses[residues] == 0
+
+	# A link residue at a peptide's C-terminus is a cleavage site, so can't be linked, unless it ends the protein
+	is_link = residue_mask(residues, link_residues)
+	link_sites = (
+		peptide_sums(is_link)
+		- (is_link[peptide_ends - 1] & (peptide_ends != ends[peptide_proteins]))
+		+ (nterm & (peptide_starts == starts[peptide_proteins]))
+	)
+
+	# Gather each peptide's residues into a fixed-width byte matrix, zeroed past its end, so viewing its rows as fixed-
+	# width byte strings gives the sequences
+	max_length = max(int((peptide_ends - peptide_starts).max(initial=0)), 1)
+	offsets = np.arange(max_length)
+	sequences = np.where(
+		offsets[None, :] < (peptide_ends - peptide_starts)[:, None],
+		residues[np.minimum(peptide_starts[:, None] + offsets[None, :], len(residues) - 1)],
+		0,
+	).astype(np.uint8)
+
+	return peptides.with_columns(
+		pl.Series("sequence", np.ascontiguousarray(sequences).view(f"S{max_length}").ravel()).cast(pl.String),
+		pl.Series("mass", np.where(peptide_sums(unknown) > 0, np.nan, peptide_sums(masses[residues]) + WATER_MASS))
+		.fill_nan(None),
+		pl.Series("link_sites", link_sites),
+	)
+
+def mean_candidates(masses, linker_mass, ppm, bin_width=0.01):
+	"""
+	Mean number of unordered pairs of the peptide masses whose crosslinked mass is within ppm of each pair's, from the
+	self-convolution of the mass histogram
+	"""
+	if len(masses) == 0:
+		return 0.0
+
+	n_bins = int(np.ceil(masses.max() / bin_width)) + 1
+	histogram = np.bincount(np.round(masses / bin_width).astype(np.int64), minlength=n_bins).astype(np.float64)
+
+	# Number of unordered pairs in each bin of summed mass: half the ordered pairs, plus half the pairs of a peptide with
+	# itself, which are only counted once among the ordered pairs
+	n_fft = 2 * n_bins
+	pairs = np.fft.irfft(np.fft.rfft(histogram, n_fft) ** 2, n_fft)[:2 * n_bins - 1].round().clip(0)
+	pairs[::2] += histogram
+	pairs /= 2
+
+	# Pairs within the tolerance of each bin, whose width grows with the crosslinked mass
+	pair_masses = np.arange(len(pairs)) * bin_width + linker_mass
+	half_width = np.ceil(pair_masses * ppm * 1e-6 / bin_width).astype(np.int64)
+	cumulative = np.concatenate([[0], np.cumsum(pairs)])
+	bins = np.arange(len(pairs))
+	in_window = cumulative[np.minimum(bins + half_width + 1, len(pairs))] - cumulative[np.maximum(bins - half_width, 0)]
+
+	return float((pairs * in_window).sum() / pairs.sum())
+
+def search_space(
+	sequences,
+	enzyme="trypsin",
+	missed_cleavages=2,
+	min_length=6,
+	max_length=40,
+	link_residues="K",
+	nterm=True,
+	linker="dss",
+	ppm=10,
+):
+	"""
+	Get the size of the crosslink search space of the protein sequences as a dict
+	"""
+	residues, starts, ends, peptides = digest(sequences, enzyme, missed_cleavages, min_length, max_length)
+	peptides = annotate_peptides(residues, starts, ends, peptides, link_residues=link_residues, nterm=nterm)
+
+	# The same peptide can have more link sites where it starts a protein or ends one
+	unique = peptides.group_by("sequence").agg(pl.col("mass").first(), pl.col("link_sites").max())
+	linkable = unique.filter(pl.col("link_sites") > 0)
+	sites = linkable.get_column("link_sites").cast(pl.Float64).to_numpy()
+
+	return {
+		"proteins": len(sequences),
+		"peptides": peptides.shape[0],
+		"unique_peptides": unique.shape[0],
+		"linkable_peptides": linkable.shape[0],
+		"link_sites": int(sites.sum()),
+		"peptide_pairs": linkable.shape[0] * (linkable.shape[0] + 1) // 2,
+		"site_pairs": int((sites.sum() ** 2 + (sites ** 2).sum()) / 2),
+		"mean_candidates": mean_candidates(
+			linkable.get_column("mass").drop_nulls().to_numpy(),
+			LINKERS[linker],
+			ppm,
+		),
+	}
+
+def read_sequences(fasta_path):
+	index = build_offset_index(fasta_path)
+	return [sequence for _, _, sequence in read_records(fasta_path, sorted(span for spans in index.values() for span in spans))]
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("fasta_paths", nargs="+")
+	parser.add_argument("--enzyme", choices=ENZYMES, default="trypsin")
+	parser.add_argument("--missed-cleavages", type=int, default=2)
+	parser.add_argument("--min-length", type=int, default=6)
+	parser.add_argument("--max-length", type=int, default=40)
+	parser.add_argument("--link-residues", default="K")
+	parser.add_argument("--no-nterm", action="store_true")
+	parser.add_argument("--linker", choices=LINKERS, default="dss")
+	parser.add_argument("--ppm", type=float, default=10)
+	parser.add_argument("--out")
+	args = parser.parse_args()
+
+	results = []
+	for fasta_path in args.fasta_paths:
+		results.append({"fasta": fasta_path, **search_space(
+			read_sequences(fasta_path),
+			enzyme=args.enzyme,
+			missed_cleavages=args.missed_cleavages,
+			min_length=args.min_length,
+			max_length=args.max_length,
+			link_residues=args.link_residues,
+			nterm=not args.no_nterm,
+			linker=args.linker,
+			ppm=args.ppm,
+		)})
+
+	df = pl.DataFrame(results)
+
+	with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=1000, fmt_str_lengths=1000):
+		print(df)
+
+	if args.out is not None:
+		df.write_csv(args.out, separator="\t")
@@ -1,28 +1,61 @@
-import glob
+import argparse
+import os
 import polars as pl
 import re
+import sys
 
-# Get the list of peptides in our spectral library
-sl_path = "../../GoDigMeta/Libraries/240126_SRSIII001_qy-4cell-24frac-noFAIMS-withContams/240126_SRSIII001_qy-4cell-24frac-withContam_RENAMED_BestPSM_SpecLib.xml"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+from peptide_keys import peptide_key
+from speclib import load_speclib
+from table_io import glob_tables, read_table, sink_table
+
+"""
+Make target lists of several sizes from the peptides found in enough of the filtered peptide tables that are also in
+the spectral library
+
+Usage: python core_peptide_view_filtered_make_target_lists.py [--speclib SPECLIB_PATH] [--filtered-dir FILTERED_DIR]
+	[--sizes N [N ...]] [--seed SEED] [--out-pattern OUT_PATTERN]
 
-with open(sl_path, "r") as sl_handle:
-	speclib_str = sl_handle.read()
+The lists are nested: one seeded shuffle of the peptides is drawn, and each list is its first N peptides, so smaller
+lists are subsets of larger ones. OUT_PATTERN is formatted with {n}, the size, and {label}, the size with thousands
+written as k (e.g. 5k, 2500), and must give a different path for each size. Repeated sizes are only written once.
+All the lists are written at once.
+"""
 
-matches = re.findall(
-	re.compile(
-		r'<LibPeptide Sequence="(.+?)" GeneSymbol="(.+?)">\n\s*<AveragedSpectrum Charge="(\d)" CV="0">',
-		re.MULTILINE,
-	),
-	speclib_str)
+def size_label(n):
+	return f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+	"--speclib",
+	default="../../GoDigMeta/Libraries/240126_SRSIII001_qy-4cell-24frac-noFAIMS-withContams/240126_SRSIII001_qy-4cell-24frac-withContam_RENAMED_BestPSM_SpecLib.xml",
+)
+parser.add_argument("--filtered-dir", default="../../GoDigMeta/TargetLists/5cell_15runs/filtered_peps")
+parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 3000, 2500, 2000, 1500, 1000, 300])
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument(
+	"--out-pattern",
+	default="../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_{label}-from-5cell15runs-in-qy4cellLib.csv",
+)
+args = parser.parse_args()
 
-peps, genes, charges = zip(*matches)
+# One list per size, each to its own path, since the lists are written concurrently
+sizes = list(dict.fromkeys(args.sizes))
+out_paths = [args.out_pattern.format(n=n, label=size_label(n)) for n in sizes]
+if len(set(out_paths)) < len(out_paths):
+	raise ValueError(f"--out-pattern {args.out_pattern} gives the same path for different sizes; use {{n}} or {{label}}")
 
+# Get the list of peptides in our spectral library
 sdf = (
-	pl.DataFrame({
-		"Peptide": peps,
-		"GeneSymbol": genes,
-		"z": charges,
-	})
+	load_speclib(args.speclib)
+	.filter(pl.col.CV == 0)
+	.select(
+		pl.col.Sequence.alias("Peptide"),
+		peptide_key(pl.col.Sequence).alias("peptide_key"),
+		pl.col.GeneSymbol,
+		pl.col.Charge.alias("z"),
+	)
 	.unique()
 )
 
@@ -30,29 +63,28 @@ sdf = (
 # Unfiltered peptide tables downloaded from peptide view in Core were filtered using the following script:
 # ../general/core_pepsOnly_processSpectralCounts.py
 dfs = []
-for filtered in sorted(glob.glob("../../GoDigMeta/TargetLists/5cell_15runs/filtered_peps/*.tsv")):
+for filtered in glob_tables(os.path.join(args.filtered_dir, "*")):
 	search = re.search(r"ed[0-9]{5}", filtered).group()
 	dfs.append(
-		pl.read_csv(filtered, separator="\t")
+		read_table(filtered, separator="\t", schema_overrides=SCHEMAS["core_peptides"])
 		.select(
 			pl.lit(search).alias("search"),
-			pl.col.peptide_sequence.str.split(".").list.get(1).alias("Peptide"),
+			peptide_key(pl.col.peptide_sequence).alias("peptide_key"),
 		)
 		.unique()
 	)
 
 df = (
 	pl.concat(dfs, how="vertical")
-	.group_by("Peptide")
+	.group_by("peptide_key")
 	.len()
 	.filter(
-		pl.col.Peptide.is_in(sdf.get_column("Peptide").implode()) &
 		(pl.col.len >= 6) &
 		(pl.col.len <= 10)
 	)
 	.join(
 		sdf,
-		on="Peptide",
+		on="peptide_key",
 		how="inner",
 	)
 	.sort(by=["len", "z"], descending=[True, False])
@@ -61,44 +93,14 @@ df = (
 	.sort(by=["GeneSymbol", "Peptide", "z"])
 )
 
-df5k = (
-	df.sample(n=5000, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df5k.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_5k-from-5cell15runs-in-qy4cellLib.csv")
+if max(sizes) > df.shape[0]:
+	raise ValueError(f"Can't take {max(sizes)} targets from {df.shape[0]} peptides")
 
-df3k = (
-	df.sample(n=3000, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df3k.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_3k-from-5cell15runs-in-qy4cellLib.csv")
+# Each peptide's position in one seeded shuffle; a list of size n is the peptides at positions below n, already in
+# sorted order
+ranked = df.with_columns(pl.int_range(pl.len()).shuffle(seed=args.seed).alias("rank")).lazy()
 
-df2500 = (
-	df.sample(n=2500, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df2500.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_2500-from-5cell15runs-in-qy4cellLib.csv")
-
-df2k = (
-	df.sample(n=2000, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df2k.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_2k-from-5cell15runs-in-qy4cellLib.csv")
-
-df1500 = (
-	df.sample(n=1500, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df1500.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_1500-from-5cell15runs-in-qy4cellLib.csv")
-
-df1k = (
-	df.sample(n=1000, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df1k.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_1k-from-5cell15runs-in-qy4cellLib.csv")
-
-df300 = (
-	df.sample(n=300, with_replacement=False, seed=0)
-	.sort("GeneSymbol", "Peptide")
-)
-df300.write_csv("../../GoDigMeta/TargetLists/5cell_15runs/new/250710_CML_300-from-5cell15runs-in-qy4cellLib.csv")
+pl.collect_all([
+	sink_table(ranked.filter(pl.col("rank") < n).drop("rank"), out_path, lazy=True)
+	for n, out_path in zip(sizes, out_paths)
+])
@@ -1,17 +1,33 @@
-import glob
+import argparse
 import os
 import polars as pl
 import sys
 
-input_dir = sys.argv[-1]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+from instrumentation import stage
+from peptide_keys import canonical_peptide
+from table_io import glob_tables, scan_table, sink_table
 
-for path in glob.glob(os.path.join(input_dir, "*_filtered.tsv")):
+"""
+Convert filtered crosslink tables (INPUT_DIR/*_filtered.tsv) to XLinkAnalyzer inputs (*_filtered_XLA.csv)
 
-	df = (
-		pl.read_csv(path, separator="\t")
+Usage: python core_peptide_view_filtered_make_xlinkanalyzer_input.py INPUT_DIR (--proteins PROTEIN [PROTEIN ...] |
+	--proteins-file PROTEINS_PATH) [--match {both,either}] [--links {all,intra,inter}] [--streaming]
+
+Crosslinks are kept if both (--match both, the default) or either (--match either) of their proteins are in the
+given set, e.g. --proteins "sp|P00563|KCRM_RABIT". --links intra keeps only links within one protein, and --links
+inter only links between two different proteins. PROTEINS_PATH has one protein per line.
+
+All the files are converted in one query, with one sink per file, so polars converts them in parallel.
+"""
+
+def scan_crosslinks(path):
+	return (
+		scan_table(path, separator="\t", schema_overrides=SCHEMAS["core_search_peptides"])
 		.select(
 			pl.col("Peptide").str.split_exact(by="-", n=1).struct.rename_fields(["seq1", "seq2"]),
-			pl.col("# XIons").str.extract("\ (\d+-\d+)$").str.split_exact(by="-", n=1).struct.rename_fields(["rel1", "rel2"]).alias("rel"),
+			pl.col("# XIons").str.extract(r"\ (\d+-\d+)$").str.split_exact(by="-", n=1).struct.rename_fields(["rel1", "rel2"]).alias("rel"),
 			pl.col("Reference").str.split_exact(by="-", n=1).struct.rename_fields(["Protein1", "Protein2"]),
 			pl.col("G.Pos.1").alias("AbsPos1"),
 			pl.col("G.Pos.2").alias("AbsPos2"),
@@ -19,8 +35,8 @@ for path in glob.glob(os.path.join(input_dir, "*_filtered.tsv")):
 		)
 		.unnest("Peptide", "rel", "Reference")
 		.with_columns(
-			pl.col("^seq\d$").str.extract(".?\.(.*)\..?").str.replace_all("[^A-Z]", ""),
-			pl.col("^Protein\d$").str.strip_chars(),
+			canonical_peptide(pl.col(r"^seq\d$")),
+			pl.col(r"^Protein\d$").str.strip_chars(),
 		)
 		.select(
 			(pl.col.seq1 + "-" + pl.col.seq2 + "-a" + pl.col.rel1 + "-b" + pl.col.rel2).alias("Id"),
@@ -30,8 +46,47 @@ for path in glob.glob(os.path.join(input_dir, "*_filtered.tsv")):
 			pl.col.AbsPos2,
 			pl.col.score,
 		)
-		#.filter(pl.all_horizontal(pl.col("^Protein\d$") == "sp|P02768|ALBU_HUMAN"))
-		.filter(pl.all_horizontal(pl.col("^Protein\d$") == "sp|P00563|KCRM_RABIT"))
 	)
 
-	df.write_csv(path.split(".")[0] + "_XLA.csv")
+def link_filter(proteins, match="both", links="all"):
+	"""
+	Expression selecting crosslinks by membership of their proteins in proteins, and by whether they're intra- or
+	inter-protein
+	"""
+	in_set = pl.col(r"^Protein\d$").is_in(list(proteins))
+	expr = pl.all_horizontal(in_set) if match == "both" else pl.any_horizontal(in_set)
+
+	if links == "intra":
+		expr = expr & (pl.col.Protein1 == pl.col.Protein2)
+	elif links == "inter":
+		expr = expr & (pl.col.Protein1 != pl.col.Protein2)
+
+	return expr
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("input_dir")
+	proteins_group = parser.add_mutually_exclusive_group(required=True)
+	proteins_group.add_argument("--proteins", nargs="+")
+	proteins_group.add_argument("--proteins-file")
+	parser.add_argument("--match", choices=["both", "either"], default="both")
+	parser.add_argument("--links", choices=["all", "intra", "inter"], default="all")
+	parser.add_argument("--streaming", action="store_true")
+	args = parser.parse_args()
+
+	if args.proteins_file is not None:
+		with open(args.proteins_file, "r") as proteins_handle:
+			proteins = {line.strip() for line in proteins_handle if line.strip() != ""}
+	else:
+		proteins = set(args.proteins)
+
+	expr = link_filter(proteins, match=args.match, links=args.links)
+
+	sinks = [
+		sink_table(scan_crosslinks(path).filter(expr), os.path.splitext(path)[0] + "_XLA.csv", lazy=True)
+		for path in glob_tables(os.path.join(args.input_dir, "*_filtered"))
+	]
+
+	with stage("collect_all"):
+		pl.collect_all(sinks, engine="streaming" if args.streaming else "in-memory")
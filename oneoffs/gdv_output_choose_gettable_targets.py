@@ -8,6 +8,9 @@ import sys
 
 from lxml import etree
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+
 # Parse the GDV target table CSVs
 gdv_csvs = []
 for file in [
@@ -19,7 +22,7 @@ for file in [
 	run = re.search(r"_([PA]R?\d)_TargetTable.csv", file).group(1)
 
 	gdv_csvs.append(
-		pl.read_csv(file, schema_overrides={"TotalSumSN": pl.Float64})
+		pl.read_csv(file, schema_overrides=SCHEMAS["gdv_target_table"])
 		.select(
 			pl.lit(run).alias("run"),
 			pl.col.GeneSymbol,
@@ -45,7 +48,7 @@ df = (
 
 # Check overlap
 v1_overlap = (
-	pl.read_csv("/mnt/cellbio/Gygi Lab/caleb/GoDigMeta/TargetLists/20250509_CML_300gettable-from-1285primed.csv")
+	pl.read_csv("/mnt/cellbio/Gygi Lab/caleb/GoDigMeta/TargetLists/20250509_CML_300gettable-from-1285primed.csv", schema_overrides=SCHEMAS["godig_targets"])
 	.join(
 		df.with_row_index(name="rank").select("GeneSymbol", "Peptide", "z", "rank"),
 		on=["GeneSymbol", "Peptide", "z"],
@@ -1,6 +1,10 @@
+import os
 import polars as pl
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+
 files = {
 	"MS1match": "3200from2000super1285primed/ed06279_CML_MS1_match-1min_pep-30sec_3PR-10bins-noNarrow-savePRLib_60min_3200_GoDig2p0_SN180_600-1k_A1_TargetTable.csv",
 	"EObin": "3200from2000super1285primed/ed06296_CML_EOBin_AR-1bin_3PR-10bins-noNarrow-savePRLib-onlyTargetPrimed_60min_3200-with-super_GoDig2p0_SN180_600-1k_A1_TargetTable.csv",
@@ -9,7 +13,7 @@ files = {
 dfs = []
 for name, run in files.items():
     dfs.append(
-        pl.read_csv(run)
+        pl.read_csv(run, schema_overrides=SCHEMAS["gdv_target_table"])
         .select(
             pl.lit(name).alias("run"),
             pl.col.Sequence,
@@ -1,10 +1,14 @@
+import os
 import polars as pl
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+
 dfs = []
 for i, pr in enumerate(sys.argv[1:]):
     dfs.append(
-        pl.read_csv(pr)
+        pl.read_csv(pr, schema_overrides=SCHEMAS["gdv_target_table"])
         .select(
             pl.lit(i).alias("pr"),
             pl.col.Sequence,
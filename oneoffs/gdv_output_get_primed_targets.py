@@ -1,7 +1,11 @@
 import glob
+import os
 import polars as pl
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
+
 """
 Get the targets that were primed in the specified runs, based on GoDig Viewer visualization export.
 """
@@ -9,7 +13,7 @@ Get the targets that were primed in the specified runs, based on GoDig Viewer vi
 dfs = []
 for file in sys.argv[1:]:
     dfs.append(
-        pl.read_csv(file)
+        pl.read_csv(file, schema_overrides=SCHEMAS["gdv_target_table"])
         .select(
             pl.col.GeneSymbol,
             pl.col.Sequence.alias("Peptide"),
@@ -1,5 +1,10 @@
 import glob
+import os
 import polars as pl
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
 
 """
 Get the targets that were missed in the specified runs, based on GoDig Viewer visualization export.
@@ -8,7 +13,7 @@ Get the targets that were missed in the specified runs, based on GoDig Viewer vi
 dfs = []
 for file in glob.glob("GoDigExperiments/Shin18plex/*_TargetTable.csv"):
     dfs.append(
-        pl.read_csv(file)
+        pl.read_csv(file, schema_overrides=SCHEMAS["gdv_target_table"])
         .select(
             pl.col.GeneSymbol,
             pl.col.Sequence.alias("Peptide"),
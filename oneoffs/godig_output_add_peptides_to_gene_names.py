@@ -1,5 +1,10 @@
 import glob
+import os
 import polars as pl
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
 
 """
 Append peptides to gene names in GoDig output to prevent aggregation at gene level by Shuken's GoDig analysis R
@@ -9,7 +14,7 @@ scripts
 for result in sorted(glob.glob("*_Result.csv")):
 
 	res = (
-		pl.read_csv(result)
+		pl.read_csv(result, schema_overrides=SCHEMAS["godig_result"])
 		.with_columns(pl.concat_str([pl.col.GeneSymbol, pl.col.Peptide], separator="_").alias("GeneSymbol"))
 	)
 
@@ -1,5 +1,10 @@
 import glob
+import os
 import polars as pl
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
 
 """
 Check the overlap between GoDig output files from experiments done with the same target list but two different
@@ -8,17 +13,9 @@ spectral libraries
 
 dfs = []
 
-schema_overrides = {
-	"Precursor Int (Log10)": pl.Float64,
-	"MS2 IT": pl.Float64,
-	"MS3 IT": pl.Float64,
-	"Fraction of Fragments": pl.Float64,
-	"Quant 3": pl.Float64,
-}
-
 for file in glob.glob("names_peptides_appended/*HCC44*Result.csv"):
 	dfs.append(
-		pl.read_csv(file, schema_overrides=schema_overrides)
+		pl.read_csv(file, schema_overrides=SCHEMAS["godig_result"])
 		.select(
 			pl.col.GeneSymbol,
 			pl.lit("HCC44").alias("lib"),
@@ -27,7 +24,7 @@ for file in glob.glob("names_peptides_appended/*HCC44*Result.csv"):
 
 for file in glob.glob("names_peptides_appended/*DTB*Result.csv"):
 	dfs.append(
-		pl.read_csv(file, schema_overrides=schema_overrides)
+		pl.read_csv(file, schema_overrides=SCHEMAS["godig_result"])
 		.select(
 			pl.col.GeneSymbol,
 			pl.lit("20k").alias("lib"),
@@ -1,13 +1,18 @@
+import os
 import polars as pl
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from speclib import load_speclib
 
 """
 Take spectral library CSV export from GoDig and create a target list from the ProKAS peptides that were found
 """
 
 df = (
-	pl.read_csv("prokas_CKS6_SpecLib_export.csv")
+	load_speclib("prokas_CKS6_SpecLib_export.csv")
 	.select(
-		pl.col.gene.alias("GeneSymbol"),
+		pl.col.gene.cast(pl.String).alias("GeneSymbol"),
 		pl.col.peptide.alias("Peptide"),
 		pl.col.prec_z.alias("z"),
 	)
@@ -1,4 +1,9 @@
+import os
 import polars as pl
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "general"))
+from export_schemas import SCHEMAS
 
 """
 Combine the two listed target lists and take 3200 randomly from them
@@ -11,7 +16,7 @@ for i, file in enumerate([
 	"250131_SRSIV001G_GoDig2p0_Primed_GoDigTargets_1285.csv",
 ]):
 	dfs.append(
-		pl.read_csv(file)
+		pl.read_csv(file, schema_overrides=SCHEMAS["godig_targets"])
 	)
 
 df = (